@@ -5,22 +5,43 @@ Automatically renames PDF invoices based on their content using the format:
 Site-Collecte-InvoiceMonthYear-InvoiceNumber
 """
 
+import io
 import os
 import re
+import hashlib
+import tempfile
 import json
 import logging
 import time
 import csv
+import threading
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
-import PyPDF2
+import pypdfium2 as pdfium
 import google.generativeai as genai
 import argparse
 from dotenv import load_dotenv
 import pandas as pd
 from difflib import SequenceMatcher
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # Optional: faster JSON serialization, stdlib json is used otherwise
+    orjson = None
+
+try:
+    from rapidfuzz import fuzz as _fuzz, process as _fuzz_process
+except ImportError:  # Optional: native prefilter for collector fuzzy matching, a length bound is used otherwise
+    _fuzz = _fuzz_process = None
+
+try:
+    import ahocorasick
+except ImportError:  # Optional: single-pass multi-substring search, per-name `in` scans are used otherwise
+    ahocorasick = None
 
 # Load environment variables
 load_dotenv()
@@ -29,13 +50,320 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# McDonald's brand prefix followed by the location part of the restaurant name
+_BRAND_LOCATION_RE = re.compile(r"(?:mcdonald'?s?|mac\s*do|macdonald'?s?)\s+(.+)", re.IGNORECASE)
+
+# French postal codes are 5 digits
+_POSTAL_CODE_RE = re.compile(r'\b(\d{5})\b')
+_WS_RE = re.compile(r'\s+')
+# McDonald's brand tokens stripped to keep the location part of a name
+_MCDO_STRIP_RE = re.compile(r'(mcdonald[s]?|mac\s*do)')
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_NON_ALNUM_RE = re.compile(r'[^a-zA-Z0-9]')
+_NON_DIGIT_RE = re.compile(r'\D')
+# Accented letters found in French invoice numbers, mapped to their base letter (what NFKD would keep)
+_DEACCENT_TABLE = str.maketrans({c: unicodedata.normalize('NFKD', c)[0] for c in 'àâäéèêëîïôöùûüÿçÀÂÄÉÈÊËÎÏÔÖÙÛÜŸÇ'})
+_SPACE_DELETE_TABLE = {ord(' '): None}
+# Delimiters between words of a provider name (space, hyphen, period)
+_PROVIDER_SPLIT_RE = re.compile(r'[\s.-]')
+
+# Common French address normalizations, applied in order
+_ADDRESS_ABBREVIATIONS = [
+    (re.compile(r'\b' + full_form + r'\b'), abbrev)
+    for full_form, abbrev in [
+        ('avenue', 'av'),
+        ('av.', 'av'),
+        ('boulevard', 'bd'),
+        ('bd.', 'bd'),
+        ('rue', 'r'),
+        ('place', 'pl'),
+        ('pl.', 'pl'),
+        ('saint', 'st'),
+        ('sainte', 'ste'),
+        ('st.', 'st'),
+        ('ste.', 'ste'),
+    ]
+]
+
+# Bump when the analysis prompts or the expected JSON fields change, to invalidate cached analyses
+ANALYSIS_CACHE_VERSION = "2"
+DEFAULT_ANALYSIS_CACHE_DIR = ".analysis_cache"
+
+# Bump when the parsed shape of the client list changes, to invalidate the .json sidecar
+TABLE_CACHE_VERSION = "1"
+
+# Gemini calls per invoice when the answer is not valid JSON (first call included)
+GEMINI_JSON_ATTEMPTS = 3
+
+# PDFs analyzed concurrently; Gemini calls are I/O-bound and the rate limiter serializes admission
+DEFAULT_MAX_WORKERS = 8
+
+# Gemini prompts. Both share the static instructions in _INVOICE_PROMPT as an identical prefix;
+# the per-invoice content (page image or extracted text) always comes last.
+_INVOICE_PROMPT = """
+Analyze this French invoice PDF and extract the following information in JSON format:
+
+1. entreprise: The company name. Be very specific and extract the full name. For example, if the name is "McDonald's Chalon Sur Saone Bowling", extract the entire name, not just "McDonald's Chalon". Look for variations of McDonald's like "MAC DO", "McDONALD'S", etc.
+2. restaurant_address: The restaurant address if mentioned (street address, city, postal code)
+3. invoice_provider: The invoice provider/collector company (like SUEZ, VEOLIA, PAPREC, etc.)
+4. invoice_date: The relevant date for filename in DD/MM/YYYY format (see critical note below)
+5. invoice_number: The invoice number (usually alphanumeric)
+6. site_number: The site number (e.g., 620). ONLY extract this if the invoice_provider is "ABCDE", "REFOOD", or "VEOLIA". For all other providers, this should be null.
+
+Important notes:
+- For "ABCDE" invoices, the site number is in a format like "Mcdonald's n°620". Extract 620.
+- For "REFOOD" invoices, the site number is found after the text "N° commande - vos références :". It might be preceded by a hyphen (e.g., "-1419"). You must extract only the number itself (e.g., "1419"). For example, from "N° commande - vos références : -353", extract 353.
+- For "VEOLIA" invoices, the site number is in a format like "MC DONALD'S - CODE RESTAURANT 865". Extract 865.
+- For McDonald's variations, normalize to include the location (e.g., "MAC DO CHALON" should be "McDonald's Chalon")
+- Extract the restaurant address if visible - this helps identify the specific location
+- CRITICAL: The address "34 BOULEVARD DES ITALIENS" belongs to "SOCIETE RUBO", which is our own company, NOT the restaurant. You MUST NOT extract this address as the `restaurant_address`. If this is the only address you can find, you MUST return `null` for the `restaurant_address` field.
+- When "SOCIETE RUBO" is present, ignore the "34 BOULEVARD DES ITALIENS" address completely and find the restaurant's actual address listed elsewhere in the document. If no other address is found, return `null`.
+- CRITICAL: "SOCIETE RUBO" is NEVER the invoice_provider. If you see "SOCIETE RUBO", you MUST find another company name in the document to use as the invoice_provider. The actual provider will be another company mentioned in the invoice.
+- The invoice provider is usually the company issuing the invoice
+- Be very careful with the invoice number - it's usually prominently displayed
+- CRITICAL FOR DATE: Look for "Période" field first, which shows a date range (e.g., "01/05/2025 - 31/05/2025"). If this exists, use the START date of the range as the invoice_date. Only if no "Période" field exists, then use the regular invoice date. The "Période" represents the service period and is more important for our filing system than the actual invoice creation date.
+"""
+
+_IMAGE_INVOICE_PROMPT = _INVOICE_PROMPT + """- CRITICAL: Look for company logos in the image! Sometimes the invoice provider will not be listed explicitly via text, in this case you MUST use the logos to identify the provider (e.g., SUEZ logo, VEOLIA logo, PAPREC logo) and use that as the invoice_provider
+- Give priority to logos over text when determining the invoice provider - if you see a PAPREC logo but text mentions "RUBO", the correct provider is PAPREC
+
+Return only valid JSON:
+"""
+
+_TEXT_INVOICE_PROMPT = _INVOICE_PROMPT + """
+Invoice text:
+{pdf_text}
+
+Return only valid JSON:
+"""
+
+# Follow-up sent when Gemini's answer is not valid JSON
+_JSON_CORRECTION_PROMPT = "Your previous response failed JSON parsing with: {error}. Return ONLY valid JSON with the requested fields, no markdown."
+
+# pdfium renders at 72 DPI for scale 1; match the 200 DPI pdf2image used before
+_PDF_RENDER_SCALE = 200 / 72
+# Page images are downscaled and JPEG-encoded before upload; invoice text stays legible
+_GEMINI_IMAGE_MAX_EDGE = 1536
+_GEMINI_JPEG_QUALITY = 85
+# pdfium is not thread-safe, so worker threads take turns inside the library
+_PDFIUM_LOCK = threading.Lock()
+
+# Markdown code fence around a JSON answer (```json ... ```)
+_CODE_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+
+
+@lru_cache(maxsize=4096)
+def _normalize_text(text: str) -> str:
+    """Normalize text by lowercasing, removing accents, and stripping extra whitespace."""
+    if not text:
+        return ""
+    
+    # NFD form separates characters from their accents
+    # Then we remove combining marks (the accents)
+    text = ''.join(c for c in unicodedata.normalize('NFD', text) 
+                   if unicodedata.category(c) != 'Mn')
+    
+    return text.lower().strip()
+
+
+@lru_cache(maxsize=2048)
+def _extract_postal_code(address: str) -> Optional[str]:
+    """Extract postal code from an address string."""
+    if not address:
+        return None
+    
+    postal_code_match = _POSTAL_CODE_RE.search(address)
+    if postal_code_match:
+        return postal_code_match.group(1)
+    
+    return None
+
+
+@lru_cache(maxsize=256)
+def _extract_first_page_text(pdf_path: str, mtime_ns: int, size: int) -> str:
+    """Parse the first page's text; mtime and size key the cache so edited files are re-read."""
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            if len(pdf) > 0:
+                return pdf[0].get_textpage().get_text_bounded()
+            return ""
+        finally:
+            pdf.close()
+
+
+def _similarity_ratio(a: str, b: str) -> float:
+    """Similarity of two strings in [0, 1], as difflib's SequenceMatcher ratio.
+
+    The matching thresholds are tuned against this ratio. rapidfuzz's fuzz.ratio is an Indel (LCS)
+    ratio, never lower than this one, so it cannot stand in for it.
+    """
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+@lru_cache(maxsize=65536)
+def _name_similarity(norm_name1: str, norm_name2: str) -> float:
+    """Similarity of two lower-cased, stripped restaurant names."""
+    return _similarity_ratio(norm_name1, norm_name2)
+
+
+@lru_cache(maxsize=1024)
+def _analysis_digest(pdf_path: str, mtime_ns: int, size: int) -> str:
+    """Hash the cache version and PDF content; mtime and size key the memo so an unchanged file is hashed once."""
+    digest = hashlib.sha256()
+    digest.update(ANALYSIS_CACHE_VERSION.encode())
+    # Stream the PDF through the hash instead of loading it whole
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1024)
+def _month_year(date_str: str) -> Optional[str]:
+    """MMYYYY for a valid DD/MM/YYYY date, else None; invoices in a batch share a handful of dates."""
+    # Positional split instead of strptime; datetime() still rejects impossible dates like 29/02/2023
+    parts = date_str.strip().split('/')
+    if len(parts) == 3:
+        day, month, year = parts
+        digits = day + month + year
+        if len(day) <= 2 and len(month) <= 2 and len(year) == 4 and digits.isascii() and digits.isdigit():
+            try:
+                datetime(int(year), int(month), int(day))
+                return month.zfill(2) + year
+            except ValueError:
+                pass
+    return None
+
+
+@lru_cache(maxsize=64)
+def _collecte_suffix(collecte: str) -> str:
+    """Upper-case collecte name with spaces removed; collecte names come from a small fixed set."""
+    return collecte.upper().translate(_SPACE_DELETE_TABLE)
+
+
+def _renamed_filename_re(collecte_suffixes) -> re.Pattern:
+    """Match filenames already in Site-Collecte-MMYYYY-InvoiceNumber form (output of a previous run)."""
+    suffixes = '|'.join(re.escape(suffix) for suffix in sorted(collecte_suffixes, key=len, reverse=True))
+    return re.compile(rf'^\d+-(?:{suffixes})-(?:0[1-9]|1[0-2])\d{{4}}-[A-Z0-9]+\.pdf$', re.IGNORECASE)
+
+
+def _trigrams(text: str) -> set:
+    return {text[j:j + 3] for j in range(len(text) - 2)}
+
+
+class _TrigramIndex:
+    """Blocking index over strings: candidates() returns a superset of the positions whose string
+    contains the query or is contained in it, so callers only verify a short list instead of every row."""
+
+    def __init__(self, items):
+        """items: (position, string) pairs."""
+        self.by_trigram = {}        # trigram -> positions of strings containing it
+        self.by_first_trigram = {}  # leading trigram -> positions
+        self.short = []             # strings under 3 chars, which have no trigram
+        self.all = []
+        for position, text in items:
+            self.all.append(position)
+            if len(text) < 3:
+                self.short.append(position)
+                continue
+            for gram in _trigrams(text):
+                self.by_trigram.setdefault(gram, []).append(position)
+            self.by_first_trigram.setdefault(text[:3], []).append(position)
+
+    def candidates(self, query: str) -> set:
+        if len(query) < 3:
+            return set(self.all)
+        # A string containing the query contains its leading trigram;
+        # a string inside the query starts with one of the query's trigrams
+        found = set(self.by_trigram.get(query[:3], ()))
+        for gram in _trigrams(query):
+            found.update(self.by_first_trigram.get(gram, ()))
+        found.update(self.short)
+        return found
+
+
+def _build_substring_automaton(words):
+    """Build an Aho-Corasick automaton over non-empty words, or None when pyahocorasick is unavailable.
+
+    Each word maps to (length, -position, position) so the longest, then earliest listed, match compares highest.
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for position, word in enumerate(words):
+        if word and not automaton.exists(word):
+            automaton.add_word(word, (len(word), -position, position))
+    if len(automaton) == 0:
+        return None
+    automaton.make_automaton()
+    return automaton
+
+
+def _longest_substring_match(automaton, text: str) -> Optional[int]:
+    """Position of the longest word found in text (earliest listed on ties), or None."""
+    best = max((value for _, value in automaton.iter(text)), default=None)
+    return best[2] if best else None
+
+
+def _contains_float(obj) -> bool:
+    if isinstance(obj, float):
+        return True
+    if isinstance(obj, dict):
+        return any(_contains_float(value) for value in obj.values())
+    if isinstance(obj, list):
+        return any(_contains_float(value) for value in obj)
+    return False
+
+
+def _is_complete_analysis(result) -> bool:
+    """Whether a Gemini answer is worth caching: a dict with every field needed to build a filename."""
+    return (isinstance(result, dict)
+            and all(result.get(field) for field in ('invoice_provider', 'invoice_date', 'invoice_number'))
+            and any(result.get(field) for field in ('entreprise', 'restaurant_address', 'site_number')))
+
+
+def _json_loads(text):
+    """Parse JSON (str or bytes) with orjson when installed, falling back to stdlib json for input orjson rejects (e.g. NaN).
+
+    orjson turns integers wider than 64 bits (an unquoted long invoice number) into lossy floats, so any
+    float in its result is re-parsed with stdlib json, which keeps integers exact.
+    """
+    if orjson is not None:
+        try:
+            result = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+        else:
+            if not _contains_float(result):
+                return result
+    return json.loads(text)
+
+
+def _json_dumps(obj) -> bytes:
+    """Serialize to compact UTF-8 JSON, with orjson when installed and stdlib json otherwise."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            pass  # e.g. integers wider than 64 bits, which stdlib json writes exactly
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
 class ProcessingLogger:
     """Enhanced logger for PDF processing with structured output and detailed reporting."""
     
     def __init__(self, log_dir: str = "logs", enable_file_logging: bool = True):
         self.log_dir = Path(log_dir)
         self.enable_file_logging = enable_file_logging
-        self.processing_results = []
+        # Per-file results are streamed to an NDJSON file; only failure/skip reasons stay in memory
+        self.results_file_handle = None
+        self.failed_files = []
+        self.skipped_files = []
+        # API requests are logged from worker threads
+        self._stats_lock = threading.Lock()
         self.session_stats = {
             'start_time': datetime.now(),
             'total_files': 0,
@@ -54,6 +382,8 @@ class ProcessingLogger:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.log_file = self.log_dir / f"pdf_renaming_{timestamp}.log"
         self.json_log_file = self.log_dir / f"pdf_renaming_{timestamp}.json"
+        self.results_file = self.log_dir / f"pdf_renaming_{timestamp}.ndjson"
+        self.results_file_handle = open(self.results_file, 'w', encoding='utf-8', buffering=1)  # Line-buffered
         
         # Create file handler with custom formatter
         self.file_handler = logging.FileHandler(self.log_file, encoding='utf-8')
@@ -81,6 +411,17 @@ class ProcessingLogger:
             logger.info(f"Log file: {self.log_file}")
             logger.info(f"JSON report: {self.json_log_file}")
     
+    def _record_result(self, record: Dict):
+        """Append one per-file result to the NDJSON results file.
+
+        Errors are logged, not raised: the file may already be renamed when its result is recorded.
+        """
+        if self.results_file_handle:
+            try:
+                self.results_file_handle.write(_json_dumps(record).decode('utf-8') + '\n')
+            except (TypeError, ValueError, OSError) as e:
+                logger.error(f"Could not record result for {record.get('original_name') or record.get('filename')}: {e}")
+    
     def log_processing_start(self, pdf_count: int, directory: str, dry_run: bool, rate_limit_status: Dict):
         """Log processing start details."""
         mode = "DRY RUN" if dry_run else "LIVE"
@@ -123,7 +464,7 @@ class ProcessingLogger:
                 logger.info(f"     Date: {extracted_data['invoice_date']}")
         
         self.session_stats['successful'] += 1
-        self.processing_results.append({
+        self._record_result({
             'status': 'success',
             'original_name': original_name,
             'new_name': new_name,
@@ -142,7 +483,8 @@ class ProcessingLogger:
                 logger.error(f"     {key}: {value}")
         
         self.session_stats['failed'] += 1
-        self.processing_results.append({
+        self.failed_files.append((filename, reason))
+        self._record_result({
             'status': 'failed',
             'filename': filename,
             'reason': reason,
@@ -156,18 +498,23 @@ class ProcessingLogger:
         logger.warning(f"   Reason: {reason}")
         
         self.session_stats['skipped'] += 1
-        self.processing_results.append({
+        self.skipped_files.append((filename, reason))
+        self._record_result({
             'status': 'skipped',
             'filename': filename,
             'reason': reason,
             'timestamp': datetime.now().isoformat()
         })
     
+    def count_api_request(self):
+        """Count one request sent to Gemini, including JSON retries, as the rate limiter does."""
+        with self._stats_lock:
+            self.session_stats['api_requests_used'] += 1
+    
     def log_api_request(self, filename: str, success: bool, response_data: Dict = None):
         """Log API request details."""
         if success:
             logger.info(f"   🔄 API request successful for {filename}")
-            self.session_stats['api_requests_used'] += 1
         else:
             logger.error(f"   🔄 API request failed for {filename}")
             if response_data:
@@ -197,15 +544,13 @@ class ProcessingLogger:
         
         if self.session_stats['failed'] > 0:
             logger.info("\n📋 FAILURE SUMMARY:")
-            for result in self.processing_results:
-                if result['status'] == 'failed':
-                    logger.info(f"   • {result['filename']}: {result['reason']}")
+            for filename, reason in self.failed_files:
+                logger.info(f"   • {filename}: {reason}")
         
         if self.session_stats['skipped'] > 0:
             logger.info("\n📋 SKIPPED FILES SUMMARY:")
-            for result in self.processing_results:
-                if result['status'] == 'skipped':
-                    logger.info(f"   • {result['filename']}: {result['reason']}")
+            for filename, reason in self.skipped_files:
+                logger.info(f"   • {filename}: {reason}")
         
         # Save detailed JSON report
         if self.enable_file_logging:
@@ -214,31 +559,40 @@ class ProcessingLogger:
         logger.info("=" * 80)
     
     def save_json_report(self, end_time: datetime, duration: timedelta):
-        """Save detailed JSON report."""
+        """Save detailed JSON report, streaming the per-file results from the NDJSON file."""
         # Prepare summary stats with serializable data
         summary_stats = self.session_stats.copy()
         summary_stats['start_time'] = self.session_stats['start_time'].isoformat()
         
-        report = {
-            'session_info': {
-                'start_time': self.session_stats['start_time'].isoformat(),
-                'end_time': end_time.isoformat(),
-                'duration_seconds': duration.total_seconds(),
-                'session_id': datetime.now().strftime('%Y%m%d_%H%M%S')
-            },
-            'summary': summary_stats,
-            'detailed_results': self.processing_results
+        session_info = {
+            'start_time': self.session_stats['start_time'].isoformat(),
+            'end_time': end_time.isoformat(),
+            'duration_seconds': duration.total_seconds(),
+            'session_id': datetime.now().strftime('%Y%m%d_%H%M%S')
         }
         
         try:
-            with open(self.json_log_file, 'w', encoding='utf-8') as f:
-                json.dump(report, f, indent=2, ensure_ascii=False)
+            # Same layout as {'session_info', 'summary', 'detailed_results'} without loading all results
+            with open(self.json_log_file, 'wb') as f:
+                f.write(b'{"session_info":' + _json_dumps(session_info))
+                f.write(b',"summary":' + _json_dumps(summary_stats))
+                f.write(b',"detailed_results":[')
+                with open(self.results_file, 'rb') as results:
+                    for i, line in enumerate(results):
+                        if i:
+                            f.write(b',')
+                        f.write(line.rstrip(b'\n'))
+                f.write(b']}')
             logger.info(f"📄 Detailed JSON report saved: {self.json_log_file}")
+            logger.info(f"📄 Per-file results (NDJSON): {self.results_file}")
         except Exception as e:
             logger.error(f"Failed to save JSON report: {e}")
     
     def cleanup(self):
-        """Cleanup logging handlers."""
+        """Cleanup logging handlers and close the results file."""
+        if self.results_file_handle:
+            self.results_file_handle.close()
+            self.results_file_handle = None
         if hasattr(self, 'file_handler'):
             logger.removeHandler(self.file_handler)
             self.file_handler.close()
@@ -254,6 +608,11 @@ class PersistentRateLimiter:
         self.max_per_day = max_per_day
         self.storage_file = Path(storage_file)
         self.verbose = os.getenv('RATE_LIMIT_VERBOSE', 'false').lower() == 'true'
+        # Serializes admission and usage data updates across worker threads
+        self._lock = threading.Lock()
+        # Last get_status() result and the moment it goes stale (see get_status)
+        self._status_snapshot = None
+        self._status_valid_until = None
         
         # Load persistent data
         self.usage_data = self._load_usage_data()
@@ -297,7 +656,6 @@ class PersistentRateLimiter:
     def _cleanup_old_data(self):
         """Remove old usage data to keep file size manageable."""
         now = datetime.now()
-        today_str = now.date().isoformat()
         
         # Keep only last 7 days of daily data
         cutoff_date = (now - timedelta(days=7)).date().isoformat()
@@ -320,14 +678,14 @@ class PersistentRateLimiter:
         # Save cleaned data
         self._save_usage_data()
     
-    def _get_today_requests(self) -> int:
+    def _get_today_requests(self, now: Optional[datetime] = None) -> int:
         """Get number of requests made today."""
-        today_str = datetime.now().date().isoformat()
+        today_str = (now or datetime.now()).date().isoformat()
         return self.usage_data['daily_requests'].get(today_str, 0)
     
-    def _get_minute_requests(self) -> List[datetime]:
+    def _get_minute_requests(self, now: Optional[datetime] = None) -> List[datetime]:
         """Get list of requests made in the last minute."""
-        now = datetime.now()
+        now = now or datetime.now()
         minute_ago = now - timedelta(minutes=1)
         
         # Convert stored ISO strings back to datetime objects for recent requests
@@ -344,68 +702,89 @@ class PersistentRateLimiter:
         
     def wait_if_needed(self, processing_logger=None):
         """Wait if necessary to respect rate limits."""
-        now = datetime.now()
-        today_str = now.date().isoformat()
-        
-        # Check daily limit
-        today_requests = self._get_today_requests()
-        if today_requests >= self.max_per_day:
-            logger.warning(f"Daily limit of {self.max_per_day} requests reached. Please try again tomorrow.")
-            raise Exception(f"Daily API limit reached ({self.max_per_day} requests)")
-        
-        # Check per-minute limit
-        minute_requests = self._get_minute_requests()
-        if len(minute_requests) >= self.max_per_minute:
-            sleep_time = 60 - (now - minute_requests[0]).total_seconds()
-            if sleep_time > 0:
-                if processing_logger:
-                    processing_logger.log_rate_limit_wait(sleep_time, f"Used {len(minute_requests)}/{self.max_per_minute} requests this minute")
-                else:
-                    logger.info(f"Rate limit: waiting {sleep_time:.1f} seconds (used {len(minute_requests)}/{self.max_per_minute} requests this minute)")
-                time.sleep(sleep_time)
-                # Refresh minute requests after waiting
-                minute_requests = self._get_minute_requests()
+        with self._lock:
+            now = datetime.now()
+            today_str = now.date().isoformat()
+        
+            # Check daily limit
+            today_requests = self._get_today_requests(now)
+            if today_requests >= self.max_per_day:
+                logger.warning(f"Daily limit of {self.max_per_day} requests reached. Please try again tomorrow.")
+                raise Exception(f"Daily API limit reached ({self.max_per_day} requests)")
+        
+            # Check per-minute limit
+            minute_requests = self._get_minute_requests(now)
+            if len(minute_requests) >= self.max_per_minute:
+                sleep_time = 60 - (now - minute_requests[0]).total_seconds()
+                if sleep_time > 0:
+                    if processing_logger:
+                        processing_logger.log_rate_limit_wait(sleep_time, f"Used {len(minute_requests)}/{self.max_per_minute} requests this minute")
+                    else:
+                        logger.info(f"Rate limit: waiting {sleep_time:.1f} seconds (used {len(minute_requests)}/{self.max_per_minute} requests this minute)")
+                    time.sleep(sleep_time)
+                    # Refresh minute requests after waiting
+                    minute_requests = self._get_minute_requests()
         
-        # Record this request
-        self.usage_data['minute_requests'].append(now.isoformat())
-        self.usage_data['daily_requests'][today_str] = today_requests + 1
+            # Record this request
+            self.usage_data['minute_requests'].append(now.isoformat())
+            self.usage_data['daily_requests'][today_str] = today_requests + 1
+            self._status_snapshot = None
         
-        # Save updated data
-        self._save_usage_data()
+            # Save updated data
+            self._save_usage_data()
         
-        if self.verbose:
-            logger.info(f"API request #{today_requests + 1} today, {len(minute_requests) + 1} this minute")
+            if self.verbose:
+                logger.info(f"API request #{today_requests + 1} today, {len(minute_requests) + 1} this minute")
     
     def get_status(self) -> Dict:
         """Get current rate limiting status."""
-        today_requests = self._get_today_requests()
-        minute_requests = self._get_minute_requests()
-        
-        # Get historical data for context
-        historical_data = []
-        for date_str, count in sorted(self.usage_data['daily_requests'].items())[-7:]:  # Last 7 days
-            historical_data.append({
-                'date': date_str,
-                'requests': count
-            })
+        with self._lock:
+            now = datetime.now()
+            if self._status_snapshot is not None and now < self._status_valid_until:
+                return self._copy_status_snapshot()
+            
+            today_requests = self._get_today_requests(now)
+            minute_requests = self._get_minute_requests(now)
+        
+            # Get historical data for context
+            historical_data = []
+            for date_str, count in sorted(self.usage_data['daily_requests'].items())[-7:]:  # Last 7 days
+                historical_data.append({
+                    'date': date_str,
+                    'requests': count
+                })
         
-        return {
-            'requests_today': today_requests,
-            'max_per_day': self.max_per_day,
-            'requests_this_minute': len(minute_requests),
-            'max_per_minute': self.max_per_minute,
-            'remaining_today': self.max_per_day - today_requests,
-            'remaining_this_minute': self.max_per_minute - len(minute_requests),
-            'historical_usage': historical_data,
-            'total_lifetime_requests': sum(self.usage_data['daily_requests'].values())
-        }
+            self._status_snapshot = {
+                'requests_today': today_requests,
+                'max_per_day': self.max_per_day,
+                'requests_this_minute': len(minute_requests),
+                'max_per_minute': self.max_per_minute,
+                'remaining_today': self.max_per_day - today_requests,
+                'remaining_this_minute': self.max_per_minute - len(minute_requests),
+                'historical_usage': historical_data,
+                'total_lifetime_requests': sum(self.usage_data['daily_requests'].values())
+            }
+            # Without new requests the snapshot only changes when the oldest request leaves the
+            # one-minute window or the day rolls over
+            self._status_valid_until = datetime(now.year, now.month, now.day) + timedelta(days=1)
+            if minute_requests:
+                self._status_valid_until = min(self._status_valid_until, min(minute_requests) + timedelta(minutes=1))
+            return self._copy_status_snapshot()
+    
+    def _copy_status_snapshot(self) -> Dict:
+        """Copy of the cached status, including its historical_usage entries, so callers cannot mutate the cache."""
+        status = dict(self._status_snapshot)
+        status['historical_usage'] = [dict(day) for day in self._status_snapshot['historical_usage']]
+        return status
     
     def reset_today_count(self):
         """Reset today's count (useful for testing or if you know the count is wrong)."""
-        today_str = datetime.now().date().isoformat()
-        self.usage_data['daily_requests'][today_str] = 0
-        self._save_usage_data()
-        logger.info("Today's request count has been reset to 0")
+        with self._lock:
+            today_str = datetime.now().date().isoformat()
+            self.usage_data['daily_requests'][today_str] = 0
+            self._status_snapshot = None
+            self._save_usage_data()
+            logger.info("Today's request count has been reset to 0")
     
     def get_weekly_summary(self) -> Dict:
         """Get a summary of API usage for the past week."""
@@ -436,8 +815,14 @@ class PersistentRateLimiter:
 RateLimiter = PersistentRateLimiter
 
 class PDFRenamer:
-    def __init__(self, api_key: str = None, csv_dir: str = ".", enable_detailed_logging: bool = True):
-        """Initialize the PDF renamer with API key and CSV directory."""
+    def __init__(self, api_key: str = None, csv_dir: str = ".", enable_detailed_logging: bool = True,
+                 analysis_cache_dir: Optional[str] = DEFAULT_ANALYSIS_CACHE_DIR,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        """Initialize the PDF renamer with API key and CSV directory.
+
+        analysis_cache_dir stores Gemini results keyed by PDF content; pass None to disable the cache.
+        max_workers is the number of PDFs analyzed concurrently.
+        """
         # Get API key from parameter or environment
         if not api_key:
             api_key = os.getenv('GEMINI_API_KEY')
@@ -448,6 +833,8 @@ class PDFRenamer:
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-2.5-flash')
         self.csv_dir = Path(csv_dir)
+        self.analysis_cache_dir = Path(analysis_cache_dir) if analysis_cache_dir else None
+        self.max_workers = max(1, max_workers)
         
         # Initialize enhanced logging
         self.processing_logger = ProcessingLogger(enable_file_logging=enable_detailed_logging)
@@ -464,9 +851,28 @@ class PDFRenamer:
         logger.info(f"Current usage: {status['requests_today']}/{status['max_per_day']} requests today")
         
         # Load data from CSV files
-        self.restaurants_data = self._load_restaurants_data()
-        self.prestataires_data = self._load_prestataires_data()
-        self.valid_collectors = self._load_valid_collectors()
+        self.restaurants_data = self._load_cached_table(
+            self.csv_dir / "Liste des clients.xlsx", self._load_restaurants_data
+        )
+        # Prestataires.csv is a few dozen lines, cheaper to parse than to cache
+        self.prestataires_data, self.valid_collectors = self._load_prestataires_and_collectors()
+        self.valid_collectors_sorted = sorted(self.valid_collectors)
+        # Collector names in Prestataires.csv order, with upper-case copies for fuzzy matching
+        self.collectors = self._extract_valid_collectors()
+        self.collectors_upper = [c.upper() for c in self.collectors]
+        # (collecte, upper-case word set) by word count and (collecte, upper-case name) by length, longest first
+        self.collectors_by_word_count = sorted(
+            ((c, frozenset(c_upper.split())) for c, c_upper in zip(self.collectors, self.collectors_upper)),
+            key=lambda item: len(item[0].split()), reverse=True
+        )
+        self.collectors_by_length = sorted(
+            zip(self.collectors, self.collectors_upper), key=lambda item: len(item[0]), reverse=True
+        )
+        self.collector_automaton = _build_substring_automaton([c_upper for _, c_upper in self.collectors_by_length])
+        # Only names built from a known collecte and a real month count as already renamed
+        self.renamed_filename_re = _renamed_filename_re({_collecte_suffix(c) for c in self.collectors})
+        # Case-insensitive collecte check used by _find_restaurant_site
+        self.valid_collectors_upper = frozenset(self.collectors_upper)
 
         # Define provider aliases to map subsidiaries to their parent company
         self.provider_aliases = {
@@ -477,22 +883,54 @@ class PDFRenamer:
         }
         if self.provider_aliases:
             logger.info(f"Loaded {len(self.provider_aliases)} provider aliases: {self.provider_aliases}")
+        self.alias_items = list(self.provider_aliases.items())
+        self.alias_automaton = _build_substring_automaton([alias.upper() for alias, _ in self.alias_items])
         
-        # Create lookup dictionaries for faster matching
+        # Create column views and lookup dictionaries for faster matching
+        self._build_restaurant_columns()
         self.restaurant_lookup = self._create_restaurant_lookup()
         
-    def _normalize_text(self, text: str) -> str:
-        """Normalize text by lowercasing, removing accents, and stripping extra whitespace."""
-        if not text:
-            return ""
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the detailed log files even when processing stops on an exception."""
+        self.processing_logger.cleanup()
+        return False
+    
+    def _load_cached_table(self, source_path: Path, loader):
+        """Return loader()'s result, reusing a JSON sidecar (<source>.json) while the source file is unchanged.
+
+        The result must be plain JSON data (lists, dicts, strings); JSON keeps the sidecar from running code on load.
+        """
+        try:
+            stat = source_path.stat()
+        except OSError:
+            return loader()  # Let the loader report the missing file
+        key = [TABLE_CACHE_VERSION, stat.st_mtime_ns, stat.st_size]
+        cache_path = source_path.with_name(source_path.name + '.json')
         
-        # NFD form separates characters from their accents
-        # Then we remove combining marks (the accents)
-        text = ''.join(c for c in unicodedata.normalize('NFD', text) 
-                       if unicodedata.category(c) != 'Mn')
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = _json_loads(f.read())
+            if cached.get('key') == key:
+                logger.info(f"Loaded {source_path.name} from cache {cache_path.name}")
+                return cached['data']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable table cache {cache_path}: {e}")
         
-        return text.lower().strip()
-
+        data = loader()
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_json_dumps({'key': key, 'data': data}))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write table cache {cache_path}: {e}")
+        return data
+    
     def _load_restaurants_data(self) -> List[Dict]:
         """Load restaurant data from Excel file only."""
         restaurants = []
@@ -506,8 +944,8 @@ class PDFRenamer:
             df.columns = df.columns.str.strip()
             
             # Expected columns: Code client, Nom, Adresse, CP
-            # Map to our expected format
-            for _, row in df.iterrows():
+            # Map to our expected format; plain dict records avoid building a pandas Series per row
+            for row in df.to_dict('records'):
                 # Handle "Code client " with trailing space
                 site_number = row.get('Code client') or row.get('Code client ')
                 restaurant_name = row.get('Nom', '').strip()
@@ -532,46 +970,70 @@ class PDFRenamer:
     
 
     
-    def _load_prestataires_data(self) -> Dict[str, List[str]]:
-        """Load prestataires data from CSV file."""
+    def _build_restaurant_columns(self):
+        """Precompute per-restaurant matching keys as parallel lists indexed like restaurants_data."""
+        self.restaurant_names_lower = [restaurant['Nom'].lower() for restaurant in self.restaurants_data]
+        self.restaurant_addresses_normalized = [
+            self._normalize_address(restaurant.get('Adresse', '')) for restaurant in self.restaurants_data
+        ]
+        self.restaurant_addresses_unaccented = [
+            _normalize_text(restaurant.get('Adresse', '').lower()) for restaurant in self.restaurants_data
+        ]
+        self.restaurant_postal_codes = [str(restaurant.get('CP', '')) for restaurant in self.restaurants_data]
+        self.restaurant_name_keys = [self._restaurant_name_key(name) for name in self.restaurant_names_lower]
+        
+        # Blocking indexes so full-table scans only verify rows that can pass _is_similar_name_key
+        # or the address keyword check: names of plain and McDonald's rows, McDonald's locations,
+        # McDonald's location words, and unaccented addresses
+        self.plain_name_index = _TrigramIndex(
+            (i, key[0]) for i, key in enumerate(self.restaurant_name_keys) if key[1] is None
+        )
+        self.mcdo_name_index = _TrigramIndex(
+            (i, key[0]) for i, key in enumerate(self.restaurant_name_keys) if key[1] is not None
+        )
+        self.mcdo_location_index = _TrigramIndex(
+            (i, key[1]) for i, key in enumerate(self.restaurant_name_keys) if key[1] is not None
+        )
+        self.restaurants_by_location_word = {}
+        for i, key in enumerate(self.restaurant_name_keys):
+            for word in key[3]:
+                self.restaurants_by_location_word.setdefault(word, []).append(i)
+        self.address_index = _TrigramIndex(enumerate(self.restaurant_addresses_unaccented))
+        
+        # Postal code -> indices into restaurants_data, in file order
+        self.restaurants_by_postal_code = {}
+        for i, postal_code in enumerate(self.restaurant_postal_codes):
+            self.restaurants_by_postal_code.setdefault(postal_code, []).append(i)
+    
+    def _load_prestataires_and_collectors(self) -> Tuple[Dict[str, List[str]], frozenset]:
+        """Load prestataires data and valid collector names from Prestataires.csv in a single pass."""
         prestataires = {}
+        valid_collectors = set()
         csv_path = self.csv_dir / "Prestataires.csv"
         
         with open(csv_path, 'r', encoding='utf-8-sig') as file:  # Handle BOM
-            reader = csv.DictReader(file, delimiter=';')
+            reader = csv.reader(file, delimiter=';')
+            header = next(reader)
+            collecte_index = header.index('Collecte')
+            combinations_index = header.index('Combinations')
             for row in reader:
-                collecte = row['Collecte'].strip()
-                combinations = [combo.strip() for combo in row['Combinations'].split(',')]
+                if not row:  # Skip blank lines
+                    continue
+                collecte = row[collecte_index].strip()
+                combinations = [combo.strip() for combo in row[combinations_index].split(',')]
                 prestataires[collecte] = combinations
+                if collecte:  # Skip empty rows
+                    valid_collectors.add(collecte)
         
         logger.info(f"Loaded prestataires data for {len(prestataires)} collecte types")
-        return prestataires
-    
-    def _load_valid_collectors(self) -> set:
-        """Load valid collector names from Prestataires.csv for validation."""
-        valid_collectors = set()
-        csv_path = self.csv_dir / "Prestataires.csv"
-        
-        try:
-            with open(csv_path, 'r', encoding='utf-8-sig') as file:
-                reader = csv.DictReader(file, delimiter=';')
-                for row in reader:
-                    collecte = row['Collecte'].strip()
-                    if collecte:  # Skip empty rows
-                        valid_collectors.add(collecte)
-            
-            logger.info(f"Loaded {len(valid_collectors)} valid collectors for validation")
-            return valid_collectors
-            
-        except Exception as e:
-            logger.error(f"Error loading valid collectors: {e}")
-            return set()
+        logger.info(f"Loaded {len(valid_collectors)} valid collectors for validation")
+        return prestataires, frozenset(valid_collectors)
     
     def _validate_collector(self, extracted_collector: str, base_collector: str) -> bool:
         """Validate that the base collector is in our valid collectors list."""
         if base_collector not in self.valid_collectors:
             logger.warning(f"❌ Invalid collector '{base_collector}' extracted from '{extracted_collector}'")
-            logger.info(f"📋 Valid collectors: {sorted(list(self.valid_collectors))}")
+            logger.info(f"📋 Valid collectors: {self.valid_collectors_sorted}")
             return False
         
         logger.info(f"✅ Collector '{base_collector}' is valid")
@@ -588,87 +1050,97 @@ class PDFRenamer:
         
         address = address.lower().strip()
         
-        # Common French address normalizations
-        address_mappings = {
-            'avenue': 'av',
-            'av.': 'av',
-            'boulevard': 'bd',
-            'bd.': 'bd',
-            'rue': 'r',
-            'place': 'pl',
-            'pl.': 'pl',
-            'saint': 'st',
-            'sainte': 'ste',
-            'st.': 'st',
-            'ste.': 'ste'
-        }
-        
-        # Apply normalizations
-        for full_form, abbrev in address_mappings.items():
-            address = re.sub(r'\b' + full_form + r'\b', abbrev, address)
+        # Apply common French address normalizations
+        for full_form_re, abbrev in _ADDRESS_ABBREVIATIONS:
+            address = full_form_re.sub(abbrev, address)
         
         # Remove extra spaces and punctuation
-        address = re.sub(r'[^\w\s]', '', address)
-        address = re.sub(r'\s+', ' ', address).strip()
+        address = _NON_WORD_RE.sub('', address)
+        address = _WS_RE.sub(' ', address).strip()
         
         return address
     
-    def _calculate_address_similarity(self, addr1: str, addr2: str) -> float:
-        """Calculate similarity between two addresses."""
-        norm_addr1 = self._normalize_address(addr1)
-        norm_addr2 = self._normalize_address(addr2)
-        
+    def _normalized_address_similarity(self, norm_addr1: str, norm_addr2: str) -> float:
+        """Calculate similarity between two addresses already passed through _normalize_address."""
         if not norm_addr1 or not norm_addr2:
             return 0.0
         
         # Use sequence matcher for similarity
-        return SequenceMatcher(None, norm_addr1, norm_addr2).ratio()
+        return _similarity_ratio(norm_addr1, norm_addr2)
     
     def _calculate_name_similarity(self, name1: str, name2: str) -> float:
         """Calculate similarity between two restaurant names."""
         if not name1 or not name2:
             return 0.0
         
-        # Normalize names for comparison
-        norm_name1 = name1.lower().strip()
-        norm_name2 = name2.lower().strip()
-        
-        # Direct similarity using sequence matcher
-        return SequenceMatcher(None, norm_name1, norm_name2).ratio()
+        # Normalize names for comparison; the same pairs recur across invoices, so scores are memoized
+        return _name_similarity(name1.lower().strip(), name2.lower().strip())
+    
+    def _best_name_match(self, name: str, indices) -> Tuple[Optional[int], float]:
+        """Return the restaurant index (among indices) whose name is most similar to name, and the similarity.
+
+        Ties go to the first index; (None, 0.0) when nothing scores above zero.
+        """
+        norm_name = name.lower().strip()
+        if not norm_name:
+            return None, 0.0
+        
+        best_index = None
+        best_similarity = 0.0
+        for i in indices:
+            similarity = self._calculate_name_similarity(norm_name, self.restaurant_names_lower[i])
+            if similarity > best_similarity:
+                best_similarity = similarity
+                best_index = i
+        return best_index, best_similarity
+    
+    def _similar_name_candidates(self, name_key: Tuple) -> set:
+        """Indices of restaurants that may pass _is_similar_name_key against name_key (a superset)."""
+        name_clean, location, long_words, _ = name_key
+        candidates = self.plain_name_index.candidates(name_clean)
+        if location is None:
+            candidates |= self.mcdo_name_index.candidates(name_clean)
+        else:
+            # McDonald's rows are compared on their location part only
+            candidates |= self.mcdo_location_index.candidates(location)
+            for word in long_words:
+                candidates.update(self.restaurants_by_location_word.get(word, ()))
+        return candidates
     
     def _find_address_matches(self, restaurant_name: str, address: str, threshold: float = 0.7) -> List[Dict]:
         """Find restaurants matching both name and address with fallback to address-only matching."""
         matches = []
-        
+        name_key = self._restaurant_name_key(restaurant_name)
+        normalized_address = self._normalize_address(address)
+
+        # Single pass: score the address of every similarly named restaurant once
+        scored_candidates = []
+        for i in sorted(self._similar_name_candidates(name_key)):
+            if self._is_similar_name_key(name_key, self.restaurant_name_keys[i]):
+                addr_similarity = self._normalized_address_similarity(
+                    normalized_address, self.restaurant_addresses_normalized[i]
+                )
+                scored_candidates.append((self.restaurants_data[i], addr_similarity))
+
         # First try exact name matches with address validation
-        for restaurant in self.restaurants_data:
-            if self._is_similar_restaurant_name(restaurant_name.lower(), restaurant['Nom'].lower()):
-                addr_similarity = self._calculate_address_similarity(address, restaurant.get('Adresse', ''))
-                if addr_similarity >= threshold:
+        for restaurant, addr_similarity in scored_candidates:
+            if addr_similarity >= threshold:
+                matches.append({
+                    'restaurant': restaurant,
+                    'address_similarity': addr_similarity,
+                    'match_type': 'name_and_address'
+                })
+
+        # If no good matches and multiple restaurants share the name, reuse the scores with a lower threshold
+        if not matches and len(scored_candidates) > 1:
+            for restaurant, addr_similarity in scored_candidates:
+                if addr_similarity >= 0.5:  # Lower threshold for fallback
                     matches.append({
                         'restaurant': restaurant,
                         'address_similarity': addr_similarity,
-                        'match_type': 'name_and_address'
+                        'match_type': 'address_fallback'
                     })
         
-        # If no good matches, try address-only matching for same name restaurants
-        if not matches:
-            name_matches = []
-            for restaurant in self.restaurants_data:
-                if self._is_similar_restaurant_name(restaurant_name.lower(), restaurant['Nom'].lower()):
-                    name_matches.append(restaurant)
-            
-            # If multiple restaurants with same name, try to match by address
-            if len(name_matches) > 1:
-                for restaurant in name_matches:
-                    addr_similarity = self._calculate_address_similarity(address, restaurant.get('Adresse', ''))
-                    if addr_similarity >= 0.5:  # Lower threshold for fallback
-                        matches.append({
-                            'restaurant': restaurant,
-                            'address_similarity': addr_similarity,
-                            'match_type': 'address_fallback'
-                        })
-        
         # Sort by address similarity (best matches first)
         matches.sort(key=lambda x: x['address_similarity'], reverse=True)
         return matches
@@ -677,10 +1149,7 @@ class PDFRenamer:
         """Create a lookup dictionary for faster restaurant matching."""
         lookup = {}
         
-        for restaurant in self.restaurants_data:
-            # Excel structure (Excel file has 'Nom' field)
-            restaurant_name = restaurant['Nom'].lower()
-            
+        for restaurant, restaurant_name in zip(self.restaurants_data, self.restaurant_names_lower):
             # Create various normalized versions for McDonald's variations
             normalized_names = self._normalize_restaurant_name(restaurant_name)
             
@@ -696,22 +1165,10 @@ class PDFRenamer:
         name = name.lower().strip()
         variations = [name]
         
-        # Handle McDonald's variations
-        if any(variant in name for variant in ['mcdonald', 'mac do', 'macdonald']):
-            # Extract location part
-            location_patterns = [
-                r"mcdonald'?s?\s+(.+)",
-                r"mac\s*do\s+(.+)",
-                r"macdonald'?s?\s+(.+)"
-            ]
-            
-            location = ""
-            for pattern in location_patterns:
-                match = re.search(pattern, name, re.IGNORECASE)
-                if match:
-                    location = match.group(1).strip()
-                    break
-            
+        # Handle McDonald's variations: one pass classifies the brand and captures the location part
+        match = _BRAND_LOCATION_RE.search(name)
+        if match:
+            location = match.group(1).strip()
             if location:
                 # Generate various McDonald's format variations
                 variations.extend([
@@ -723,119 +1180,90 @@ class PDFRenamer:
                     location  # Just the location name
                 ])
         
-        # Clean up common variations
-        cleaned_variations = []
+        # Clean up common variations, deduplicating as we go
+        cleaned_variations = set()
         for var in variations:
             # Remove extra spaces and normalize
-            cleaned = re.sub(r'\s+', ' ', var).strip()
-            cleaned_variations.append(cleaned)
+            cleaned = _WS_RE.sub(' ', var).strip()
+            cleaned_variations.add(cleaned)
             
             # Also add version without apostrophes
             if "'" in cleaned:
-                cleaned_variations.append(cleaned.replace("'", ""))
+                cleaned_variations.add(cleaned.replace("'", ""))
         
-        return list(set(cleaned_variations))
+        return list(cleaned_variations)
     
     def _extract_pdf_text(self, pdf_path: Path) -> str:
         """Extract text from the first page of a PDF."""
         try:
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                if len(reader.pages) > 0:
-                    return reader.pages[0].extract_text()
-                return ""
+            stat = pdf_path.stat()
+            return _extract_first_page_text(str(pdf_path), stat.st_mtime_ns, stat.st_size)
         except Exception as e:
             logger.error(f"Error extracting text from {pdf_path}: {e}")
             return ""
     
     def _analyze_invoice_with_gemini(self, pdf_path: Path, filename: str = "unknown") -> Dict:
         """Use Gemini to analyze invoice content and extract key information."""
-        prompt = """
-        Analyze this French invoice PDF and extract the following information in JSON format:
-        
-        1. entreprise: The company name. Be very specific and extract the full name. For example, if the name is "McDonald's Chalon Sur Saone Bowling", extract the entire name, not just "McDonald's Chalon". Look for variations of McDonald's like "MAC DO", "McDONALD'S", etc.
-        2. restaurant_address: The restaurant address if mentioned (street address, city, postal code)
-        3. invoice_provider: The invoice provider/collector company (like SUEZ, VEOLIA, PAPREC, etc.)
-        4. invoice_date: The relevant date for filename in DD/MM/YYYY format (see critical note below)
-        5. invoice_number: The invoice number (usually alphanumeric)
-        6. site_number: The site number (e.g., 620). ONLY extract this if the invoice_provider is "ABCDE", "REFOOD", or "VEOLIA". For all other providers, this should be null.
-        
-        Important notes:
-        - For "ABCDE" invoices, the site number is in a format like "Mcdonald's n°620". Extract 620.
-        - For "REFOOD" invoices, the site number is found after the text "N° commande - vos références :". It might be preceded by a hyphen (e.g., "-1419"). You must extract only the number itself (e.g., "1419"). For example, from "N° commande - vos références : -353", extract 353.
-        - For "VEOLIA" invoices, the site number is in a format like "MC DONALD'S - CODE RESTAURANT 865". Extract 865.
-        - For McDonald's variations, normalize to include the location (e.g., "MAC DO CHALON" should be "McDonald's Chalon")
-        - Extract the restaurant address if visible - this helps identify the specific location
-        - CRITICAL: The address "34 BOULEVARD DES ITALIENS" belongs to "SOCIETE RUBO", which is our own company, NOT the restaurant. You MUST NOT extract this address as the `restaurant_address`. If this is the only address you can find, you MUST return `null` for the `restaurant_address` field.
-        - When "SOCIETE RUBO" is present, ignore the "34 BOULEVARD DES ITALIENS" address completely and find the restaurant's actual address listed elsewhere in the document. If no other address is found, return `null`.
-        - CRITICAL: "SOCIETE RUBO" is NEVER the invoice_provider. If you see "SOCIETE RUBO", you MUST find another company name in the document to use as the invoice_provider. The actual provider will be another company mentioned in the invoice (e.g., a logo, another address).
-        - The invoice provider is usually the company issuing the invoice
-        - Be very careful with the invoice number - it's usually prominently displayed
-        - CRITICAL: Look for company logos in the image! Sometimes the invoice provider will not be listed explicitly via text, in this case you MUST use the logos to identify the provider (e.g., SUEZ logo, VEOLIA logo, PAPREC logo) and use that as the invoice_provider
-        - Give priority to logos over text when determining the invoice provider - if you see a PAPREC logo but text mentions "RUBO", the correct provider is PAPREC
-        - CRITICAL FOR DATE: Look for "Période" field first, which shows a date range (e.g., "01/05/2025 - 31/05/2025"). If this exists, use the START date of the range as the invoice_date. Only if no "Période" field exists, then use the regular invoice date. The "Période" represents the service period and is more important for our filing system than the actual invoice creation date.
-        
-        Return only valid JSON:
-        """
+        # Reuse a previous analysis of the same PDF content without spending an API request
+        cache_path = self._analysis_cache_path(pdf_path)
+        if cache_path:
+            cached_result = self._load_cached_analysis(cache_path)
+            if cached_result is not None:
+                logger.info(f"   💾 Using cached analysis for {filename}")
+                return cached_result
         
         try:
-            # Wait if necessary to respect rate limits
-            self.rate_limiter.wait_if_needed(self.processing_logger)
-            
-            # Convert PDF to image for Gemini analysis
+            # Convert PDF to image for Gemini analysis.
+            # This stays outside the rate-limited section so workers rasterize in parallel.
             pdf_image = self._convert_pdf_to_image(pdf_path)
+            if pdf_image is not None:
+                pdf_image = self._encode_image_for_gemini(pdf_image)
             if pdf_image is None:
                 # Fallback to text extraction if image conversion fails
                 pdf_text = self._extract_pdf_text(pdf_path)
                 if not pdf_text:
                     logger.error(f"Could not extract text or convert to image from {pdf_path}")
                     return {}
-                
+            
+            if pdf_image is None:
                 # Use text-based analysis as fallback
-                text_prompt = f"""
-                Analyze this French invoice text and extract the following information in JSON format:
-                
-                1. entreprise: The company name. Be very specific and extract the full name. For example, if the name is "McDonald's Chalon Sur Saone Bowling", extract the entire name, not just "McDonald's Chalon". Look for variations of McDonald's like "MAC DO", "McDONALD'S", etc.
-                2. restaurant_address: The restaurant address if mentioned (street address, city, postal code)
-                3. invoice_provider: The invoice provider/collector company (like SUEZ, VEOLIA, PAPREC, etc.)
-                4. invoice_date: The relevant date for filename in DD/MM/YYYY format (see critical note below)
-                5. invoice_number: The invoice number (usually alphanumeric)
-                6. site_number: The site number (e.g., 620). ONLY extract this if the invoice_provider is "ABCDE", "REFOOD", or "VEOLIA". For all other providers, this should be null.
-                
-                Important notes:
-                - For "ABCDE" invoices, the site number is in a format like "Mcdonald's n°620". Extract 620.
-                - For "REFOOD" invoices, the site number is found after the text "N° commande - vos références :". It might be preceded by a hyphen (e.g., "-1419"). You must extract only the number itself (e.g., "1419"). For example, from "N° commande - vos références : -353", extract 353.
-                - For "VEOLIA" invoices, the site number is in a format like "MC DONALD'S - CODE RESTAURANT 865". Extract 865.
-                - For McDonald's variations, normalize to include the location (e.g., "MAC DO CHALON" should be "McDonald's Chalon")
-                - Extract the restaurant address if visible - this helps identify the specific location
-                - CRITICAL: The address "34 BOULEVARD DES ITALIENS" belongs to "SOCIETE RUBO", which is our own company, NOT the restaurant. You MUST NOT extract this address as the `restaurant_address`. If this is the only address you can find, you MUST return `null` for the `restaurant_address` field.
-                - When "SOCIETE RUBO" is present, ignore the "34 BOULEVARD DES ITALIENS" address completely and find the restaurant's actual address listed elsewhere in the document. If no other address is found, return `null`.
-                - CRITICAL: "SOCIETE RUBO" is NEVER the invoice_provider. If you see "SOCIETE RUBO", you MUST find another company name in the document to use as the invoice_provider. The actual provider will be another company mentioned in the invoice.
-                - The invoice provider is usually the company issuing the invoice
-                - Be very careful with the invoice number - it's usually prominently displayed
-                - CRITICAL FOR DATE: Look for "Période" field first, which shows a date range (e.g., "01/05/2025 - 31/05/2025"). If this exists, use the START date of the range as the invoice_date. Only if no "Période" field exists, then use the regular invoice date. The "Période" represents the service period and is more important for our filing system than the actual invoice creation date.
-                
-                Invoice text:
-                {pdf_text}
-                
-                Return only valid JSON:
-                """
-                response = self.model.generate_content(text_prompt)
+                prompt_parts = [_TEXT_INVOICE_PROMPT.format(pdf_text=pdf_text)]
             else:
                 # Use image-based analysis
-                response = self.model.generate_content([prompt, pdf_image])
-            
-            # Clean the response to extract JSON
-            response_text = response.text.strip()
+                prompt_parts = [_IMAGE_INVOICE_PROMPT, pdf_image]
+            contents = [{'role': 'user', 'parts': prompt_parts}]
             
-            # Remove markdown code blocks if present
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
+            # Malformed JSON is sent back to Gemini with the parse error instead of dropping the file
+            for attempt in range(1, GEMINI_JSON_ATTEMPTS + 1):
+                if attempt > 1:
+                    # Exponential backoff between retries: 1s, 2s, ...
+                    time.sleep(2 ** (attempt - 2))
+                
+                # Wait if necessary to respect rate limits
+                self.rate_limiter.wait_if_needed(self.processing_logger)
+                self.processing_logger.count_api_request()
+                response = self.model.generate_content(contents)
+                
+                # Clean the response to extract JSON: strip surrounding markdown code fences in one pass
+                response_text = _CODE_FENCE_RE.sub('', response.text)
+                try:
+                    result = _json_loads(response_text)
+                    break
+                except ValueError as e:
+                    logger.warning(f"   ⚠️  Invalid JSON from Gemini for {filename} (attempt {attempt}/{GEMINI_JSON_ATTEMPTS}): {e}")
+                    if attempt == GEMINI_JSON_ATTEMPTS:
+                        raise
+                    contents = contents + [
+                        {'role': 'model', 'parts': [response.text]},
+                        {'role': 'user', 'parts': [_JSON_CORRECTION_PROMPT.format(error=repr(e))]},
+                    ]
             
-            result = json.loads(response_text)
+            if attempt > 1:
+                logger.info(f"   🔁 Valid JSON received for {filename} after {attempt} attempts")
             self.processing_logger.log_api_request(filename, True, result)
+            # Incomplete answers are not cached, so a later run asks Gemini again
+            if cache_path and _is_complete_analysis(result):
+                self._save_cached_analysis(cache_path, result)
             
             return result
         except Exception as e:
@@ -843,35 +1271,73 @@ class PDFRenamer:
             self.processing_logger.log_api_request(filename, False, {"error": str(e)})
             return {}
     
-    def _convert_pdf_to_image(self, pdf_path: Path):
-        """Convert the first page of a PDF to an image for Gemini analysis."""
+    def _analysis_cache_path(self, pdf_path: Path) -> Optional[Path]:
+        """Return the cache file for a PDF's analysis, keyed by cache version and PDF content."""
+        if not self.analysis_cache_dir:
+            return None
         try:
-            import pdf2image
-            from PIL import Image
-            
-            # Convert first page of PDF to image
-            images = pdf2image.convert_from_path(pdf_path, first_page=1, last_page=1)
-            if images:
-                return images[0]  # Return PIL Image object
+            stat = pdf_path.stat()
+            digest = _analysis_digest(str(pdf_path), stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            logger.warning(f"Could not hash {pdf_path} for the analysis cache: {e}")
+            return None
+        return self.analysis_cache_dir / f"{digest}.json"
+    
+    def _load_cached_analysis(self, cache_path: Path) -> Optional[Dict]:
+        """Load a cached analysis, or None if there is no usable entry."""
+        try:
+            cached_result = _json_loads(cache_path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable analysis cache entry {cache_path}: {e}")
             return None
-        except ImportError:
-            logger.warning("pdf2image not available, falling back to text extraction")
+        if not _is_complete_analysis(cached_result):
+            logger.warning(f"Ignoring incomplete analysis cache entry {cache_path}")
             return None
+        return cached_result
+    
+    def _save_cached_analysis(self, cache_path: Path, result: Dict):
+        """Write an analysis to the cache atomically (temporary file + rename)."""
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_json_dumps(result))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write analysis cache entry {cache_path}: {e}")
+    
+    def _convert_pdf_to_image(self, pdf_path: Path):
+        """Convert the first page of a PDF to an image for Gemini analysis."""
+        try:
+            # Render first page of PDF in-process (no Poppler subprocess)
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(str(pdf_path))
+                try:
+                    if len(pdf) > 0:
+                        return pdf[0].render(scale=_PDF_RENDER_SCALE).to_pil()  # Return PIL Image object
+                    return None
+                finally:
+                    pdf.close()
         except Exception as e:
             logger.warning(f"Could not convert PDF to image: {e}, falling back to text extraction")
             return None
     
-    def _extract_postal_code(self, address: str) -> Optional[str]:
-        """Extract postal code from an address string."""
-        if not address:
-            return None
-        
-        # French postal codes are 5 digits
-        postal_code_match = re.search(r'\b(\d{5})\b', address)
-        if postal_code_match:
-            return postal_code_match.group(1)
-        
-        return None
+    def _encode_image_for_gemini(self, image):
+        """Downscale a page image and JPEG-encode it as an inline blob to cut upload size."""
+        try:
+            from PIL import Image
+            
+            image.thumbnail((_GEMINI_IMAGE_MAX_EDGE, _GEMINI_IMAGE_MAX_EDGE), Image.LANCZOS)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=_GEMINI_JPEG_QUALITY, optimize=True)
+            return {'mime_type': 'image/jpeg', 'data': buffer.getvalue()}
+        except Exception as e:
+            logger.warning(f"Could not re-encode page image: {e}, sending it unchanged")
+            return image
     
     def _find_postal_code_matches(self, invoice_postal_code: str, restaurant_name: str = "") -> List[Dict]:
         """Find restaurants matching postal code with optional name similarity."""
@@ -880,35 +1346,37 @@ class PDFRenamer:
         if not invoice_postal_code:
             return matches
         
-        for restaurant in self.restaurants_data:
-            # Check if restaurant has CP (Code Postal) field
-            restaurant_postal_code = restaurant.get('CP', '')
-            if str(restaurant_postal_code) == invoice_postal_code:
-                # If restaurant name provided, check for name similarity as well
-                name_similarity = 0.0
-                if restaurant_name:
-                    restaurant_name_clean = restaurant.get('Nom', '').lower()
-                    # Check for partial name matches (like "Marzy" in "Nevers Marzy")
-                    name_parts = restaurant_name.lower().split()
-                    for part in name_parts:
-                        if part in restaurant_name_clean:
-                            name_similarity = 1.0
-                            break
-                    
-                    # Also check reverse (restaurant name parts in invoice name)
-                    if name_similarity == 0.0:
-                        restaurant_parts = restaurant_name_clean.split()
-                        for part in restaurant_parts:
-                            if part in restaurant_name.lower():
-                                name_similarity = 0.8
-                                break
+        restaurant_name_lower = restaurant_name.lower()
+        name_parts = restaurant_name_lower.split()
+        
+        # Only restaurants sharing the postal code (CP) are candidates
+        for i in self.restaurants_by_postal_code.get(invoice_postal_code, ()):
+            restaurant = self.restaurants_data[i]
+            # If restaurant name provided, check for name similarity as well
+            name_similarity = 0.0
+            if restaurant_name:
+                restaurant_name_clean = self.restaurant_names_lower[i]
+                # Check for partial name matches (like "Marzy" in "Nevers Marzy")
+                for part in name_parts:
+                    if part in restaurant_name_clean:
+                        name_similarity = 1.0
+                        break
                 
-                matches.append({
-                    'restaurant': restaurant,
-                    'name_similarity': name_similarity,
-                    'match_type': 'postal_code'
-                })
-        
+                # Also check reverse (restaurant name parts in invoice name)
+                if name_similarity == 0.0:
+                    restaurant_parts = restaurant_name_clean.split()
+                    for part in restaurant_parts:
+                        if part in restaurant_name_lower:
+                            name_similarity = 0.8
+                            break
+            
+            matches.append({
+                'restaurant': restaurant,
+                'index': i,
+                'name_similarity': name_similarity,
+                'match_type': 'postal_code'
+            })
+    
         # Sort by name similarity (if restaurant name provided), otherwise just return all matches
         if restaurant_name:
             matches.sort(key=lambda x: x['name_similarity'], reverse=True)
@@ -922,32 +1390,40 @@ class PDFRenamer:
             Tuple[Optional[str], Optional[str]]: (site_number, restaurant_name) or (None, None) if not found
         """
         normalized_name = entreprise_name.lower().strip() if entreprise_name else ""
+        invoice_postal_code = _extract_postal_code(restaurant_address) if restaurant_address else None
         
         # First try: Name-based matching, now enhanced to check address
         name_matches = []
+        name_match_indices = []
         if normalized_name:
             # Extract keywords from AI-provided name (e.g., "traversiere" from "mcdonald's traversiere")
-            normalized_keywords_str = self._normalize_text(re.sub(r'(mcdonald[s]?|mac\s*do)', '', normalized_name).strip())
-            name_keywords = set(normalized_keywords_str.split())
-
-            for restaurant in self.restaurants_data:
-                restaurant_name = restaurant.get('Nom', '').lower()
-                db_address = restaurant.get('Adresse', '').lower()
-
-                # Condition 1: Check for similarity in name
-                is_similar_name = self._is_similar_restaurant_name(normalized_name, restaurant_name)
-
-                # Condition 2: Check if keywords from AI name are in the DB address (accent-insensitive)
-                normalized_db_address = self._normalize_text(db_address)
-                address_contains_keyword = False
-                if name_keywords:
-                    for keyword in name_keywords:
-                        if len(keyword) > 3 and keyword in normalized_db_address:
-                            address_contains_keyword = True
-                            break
-                
-                if is_similar_name or address_contains_keyword:
-                    name_matches.append(restaurant)
+            # Only keywords longer than 3 characters are meaningful in an address
+            normalized_keywords_str = _normalize_text(_MCDO_STRIP_RE.sub('', normalized_name).strip())
+            long_keywords = tuple({keyword for keyword in normalized_keywords_str.split() if len(keyword) > 3})
+            name_key = self._restaurant_name_key(normalized_name)
+
+            # Scan restaurants sharing the invoice's postal code first; the full table only if none of them match
+            candidate_scans = []
+            if invoice_postal_code in self.restaurants_by_postal_code:
+                candidate_scans.append(self.restaurants_by_postal_code[invoice_postal_code])
+            # Full-table pass, restricted to rows the blocking indexes say can match
+            table_candidates = self._similar_name_candidates(name_key)
+            for keyword in long_keywords:
+                table_candidates |= self.address_index.candidates(keyword)
+            candidate_scans.append(sorted(table_candidates))
+            
+            for candidates in candidate_scans:
+                for i in candidates:
+                    # Condition 1 (cheap, checked first): keywords from AI name in the DB address (accent-insensitive)
+                    normalized_db_address = self.restaurant_addresses_unaccented[i]
+                    address_contains_keyword = any(keyword in normalized_db_address for keyword in long_keywords)
+                    
+                    # Condition 2: Check for similarity in name, only needed when the address check failed
+                    if address_contains_keyword or self._is_similar_name_key(name_key, self.restaurant_name_keys[i]):
+                        name_matches.append(self.restaurants_data[i])
+                        name_match_indices.append(i)
+                if name_matches:
+                    break
         
         # If no name provided or no Excel matches found, try address-based matching if address provided
         if not name_matches and restaurant_address:
@@ -959,7 +1435,7 @@ class PDFRenamer:
             if address_matches:
                 # Use the best address match
                 best_match = address_matches[0]['restaurant']
-                site_number = best_match.get('Site', best_match.get('Code client'))
+                site_number = self._site_of(best_match)
                 matched_name = best_match.get('Nom', '')
                 if site_number:
                     logger.info(f"Found via address matching: {entreprise_name} -> {matched_name} (Site {site_number})")
@@ -967,7 +1443,6 @@ class PDFRenamer:
         
         # If still no matches, try postal code matching as final fallback
         if not name_matches and restaurant_address:
-            invoice_postal_code = self._extract_postal_code(restaurant_address)
             if invoice_postal_code:
                 search_desc = f"'{entreprise_name}'" if entreprise_name else "restaurant address"
                 logger.info(f"No name/address matches found for {search_desc}, trying postal code matching with {invoice_postal_code}...")
@@ -975,7 +1450,7 @@ class PDFRenamer:
                 if postal_matches:
                     # Use the best postal code match (highest name similarity)
                     best_match = postal_matches[0]['restaurant']
-                    site_number = best_match.get('Site', best_match.get('Code client'))
+                    site_number = self._site_of(best_match)
                     matched_name = best_match.get('Nom', '')
                     if site_number:
                         logger.info(f"Found via postal code matching: {search_desc} -> {matched_name} (Site {site_number}, CP: {invoice_postal_code})")
@@ -989,8 +1464,7 @@ class PDFRenamer:
         
         # Filter name matches by collecte if available (for Excel data, collecte is not part of the row)
         # Since Excel doesn't have collecte column, we validate against Prestataires.csv separately
-        valid_collectors = self._extract_valid_collectors()
-        if collecte.upper() not in [c.upper() for c in valid_collectors]:
+        if collecte.upper() not in self.valid_collectors_upper:
             logger.warning(f"Invalid collecte '{collecte}' not found in Prestataires.csv")
             return None, None
         
@@ -1000,11 +1474,11 @@ class PDFRenamer:
             
             best_match = None
             best_similarity = 0.0
+            invoice_address_normalized = self._normalize_address(restaurant_address)
             
-            for restaurant in name_matches:
-                addr_similarity = self._calculate_address_similarity(
-                    restaurant_address, 
-                    restaurant.get('Adresse', '')
+            for i, restaurant in zip(name_match_indices, name_matches):
+                addr_similarity = self._normalized_address_similarity(
+                    invoice_address_normalized, self.restaurant_addresses_normalized[i]
                 )
                 if addr_similarity > best_similarity:
                     best_similarity = addr_similarity
@@ -1012,7 +1486,6 @@ class PDFRenamer:
             
             if best_match and best_similarity > 0.6:  # Lowered threshold for higher confidence
                 # Additional validation: check postal code if available
-                invoice_postal_code = self._extract_postal_code(restaurant_address)
                 restaurant_postal_code = best_match.get('CP', '')
                 
                 if invoice_postal_code and restaurant_postal_code:
@@ -1022,7 +1495,7 @@ class PDFRenamer:
                         # Allow very strong address matches (>0.8) to override postal code mismatches
                         if best_similarity > 0.8:
                             logger.info(f"⚠️  OVERRIDE: Accepting high-confidence address match despite postal code mismatch: {best_match.get('Nom', '')} (Site {best_match.get('Site', '')}, similarity: {best_similarity:.2f})")
-                            site_number = best_match.get('Site', best_match.get('Code client'))
+                            site_number = self._site_of(best_match)
                             matched_name = best_match.get('Nom', '')
                             if site_number:
                                 logger.info(f"Address disambiguation successful with postal code override: {entreprise_name} -> {matched_name} (Site {site_number}, similarity: {best_similarity:.2f}, invoice CP: {invoice_postal_code}, restaurant CP: {restaurant_postal_code})")
@@ -1030,14 +1503,14 @@ class PDFRenamer:
                         else:
                             logger.info(f"Rejecting address match due to postal code mismatch: {best_match.get('Nom', '')} (Site {best_match.get('Site', '')}, similarity: {best_similarity:.2f})")
                     else:
-                        site_number = best_match.get('Site', best_match.get('Code client'))
+                        site_number = self._site_of(best_match)
                         matched_name = best_match.get('Nom', '')
                         if site_number:
                             logger.info(f"Address disambiguation successful with postal code validation: {entreprise_name} -> {matched_name} (Site {site_number}, similarity: {best_similarity:.2f}, CP: {invoice_postal_code})")
                             return str(site_number), matched_name
                 else:
                     # No postal code available for validation - proceed with address match
-                    site_number = best_match.get('Site', best_match.get('Code client'))
+                    site_number = self._site_of(best_match)
                     matched_name = best_match.get('Nom', '')
                     if site_number:
                         logger.info(f"Address disambiguation successful (no postal code validation): {entreprise_name} -> {matched_name} (Site {site_number}, similarity: {best_similarity:.2f})")
@@ -1046,7 +1519,6 @@ class PDFRenamer:
                 logger.info(f"Best address match has low similarity ({best_similarity:.2f}) - threshold is 0.6")
             
             # If address disambiguation failed, try global postal code matching immediately
-            invoice_postal_code = self._extract_postal_code(restaurant_address)
             if invoice_postal_code:
                 logger.info(f"Address disambiguation failed, trying global postal code matching with {invoice_postal_code}...")
                 postal_matches = self._find_postal_code_matches(invoice_postal_code, entreprise_name or "")
@@ -1054,7 +1526,7 @@ class PDFRenamer:
                     if len(postal_matches) == 1:
                         # Single global match
                         best_match = postal_matches[0]['restaurant']
-                        site_number = best_match.get('Site', best_match.get('Code client'))
+                        site_number = self._site_of(best_match)
                         matched_name = best_match.get('Nom', '')
                         if site_number:
                             logger.info(f"Found via global postal code matching: {entreprise_name} -> {matched_name} (Site {site_number}, CP: {invoice_postal_code})")
@@ -1064,21 +1536,29 @@ class PDFRenamer:
                         logger.info(f"Found {len(postal_matches)} global postal code matches, using combined name and address score to select best match...")
                         best_match = None
                         best_combined_score = 0.0
+                        # Invoice-side values are the same for every candidate
+                        invoice_address_normalized = self._normalize_address(restaurant_address)
+                        entreprise = entreprise_name or ""
+                        entreprise_lower = entreprise.lower()
+                        entreprise_len = len(entreprise)
                         
                         for match_info in postal_matches:
                             restaurant = match_info['restaurant']
                             restaurant_name = restaurant.get('Nom', '')
+                            restaurant_name_lower = self.restaurant_names_lower[match_info['index']]
                             
-                            addr_similarity = self._calculate_address_similarity(restaurant_address, restaurant.get('Adresse', ''))
-                            name_similarity = self._calculate_name_similarity(entreprise_name or "", restaurant_name)
+                            addr_similarity = self._normalized_address_similarity(
+                                invoice_address_normalized, self.restaurant_addresses_normalized[match_info['index']]
+                            )
+                            name_similarity = self._calculate_name_similarity(entreprise, restaurant_name)
 
                             # Give preference to shorter, more exact matches ("less is more")
                             # Penalize if the DB name is much longer than the invoice name but contains it
-                            if len(restaurant_name) > len(entreprise_name or "") and (entreprise_name or "").lower() in restaurant_name.lower():
+                            if len(restaurant_name) > entreprise_len and entreprise_lower in restaurant_name_lower:
                                 name_similarity *= 0.9
 
                             # Boost exact matches significantly
-                            if restaurant_name.lower() == (entreprise_name or "").lower():
+                            if restaurant_name_lower == entreprise_lower:
                                 name_similarity = 1.5
                             
                             # Weights for combining scores
@@ -1094,7 +1574,7 @@ class PDFRenamer:
                                 best_match = restaurant
                         
                         if best_match and best_combined_score >= 0.5:  # Use a threshold for the combined score
-                            site_number = best_match.get('Site', best_match.get('Code client'))
+                            site_number = self._site_of(best_match)
                             matched_name = best_match.get('Nom', '')
                             if site_number:
                                 logger.info(f"Best global postal code + combined score match: {entreprise_name} -> {matched_name} (Site {site_number}, score: {best_combined_score:.2f}, CP: {invoice_postal_code})")
@@ -1111,16 +1591,16 @@ class PDFRenamer:
                 logger.info(f"  {i+1}. {restaurant.get('Nom', '')} (Site {restaurant.get('Site', '')}, CP {restaurant.get('CP', '')})")
             
             # If we have a postal code from the invoice, validate against it
-            invoice_postal_code = self._extract_postal_code(restaurant_address) if restaurant_address else None
             if invoice_postal_code:
                 logger.info(f"Validating name matches against invoice postal code {invoice_postal_code}...")
                 
                 # First, try to find exact matches within the name matches
                 postal_code_name_matches = []
-                for restaurant in name_matches:
-                    restaurant_postal_code = restaurant.get('CP', '')
-                    if str(restaurant_postal_code) == invoice_postal_code:
+                postal_code_name_indices = []
+                for i, restaurant in zip(name_match_indices, name_matches):
+                    if self.restaurant_postal_codes[i] == invoice_postal_code:
                         postal_code_name_matches.append(restaurant)
+                        postal_code_name_indices.append(i)
                 
                 if postal_code_name_matches:
                     # Found matches within name matches - use name similarity to pick the best one
@@ -1132,9 +1612,8 @@ class PDFRenamer:
                         best_match = None
                         best_similarity = 0.0
                         
-                        for restaurant in postal_code_name_matches:
-                            restaurant_name = restaurant.get('Nom', '').lower()
-                            similarity = self._calculate_name_similarity(normalized_name, restaurant_name)
+                        for i, restaurant in zip(postal_code_name_indices, postal_code_name_matches):
+                            similarity = self._calculate_name_similarity(normalized_name, self.restaurant_names_lower[i])
                             logger.info(f"  Name similarity: {similarity:.2f} for {restaurant.get('Nom', '')} (Site {restaurant.get('Site', '')})")
                             if similarity > best_similarity:
                                 best_similarity = similarity
@@ -1142,7 +1621,7 @@ class PDFRenamer:
                         
                         logger.info(f"Best name match within postal code matches: {best_match.get('Nom', '')} (similarity: {best_similarity:.2f})")
                     
-                    site_number = best_match.get('Site', best_match.get('Code client'))
+                    site_number = self._site_of(best_match)
                     matched_name = best_match.get('Nom', '')
                     if site_number:
                         logger.info(f"Found validated match: {entreprise_name} -> {matched_name} (Site {site_number}, CP: {invoice_postal_code})")
@@ -1150,11 +1629,8 @@ class PDFRenamer:
                 else:
                     # No matches within name matches - search ALL restaurants with this postal code
                     logger.info(f"No postal code matches within name matches, searching all restaurants with postal code {invoice_postal_code}...")
-                    all_postal_matches = []
-                    for restaurant in self.restaurants_data:
-                        restaurant_postal_code = restaurant.get('CP', '')
-                        if str(restaurant_postal_code) == invoice_postal_code:
-                            all_postal_matches.append(restaurant)
+                    postal_indices = self.restaurants_by_postal_code.get(invoice_postal_code, ())
+                    all_postal_matches = [self.restaurants_data[i] for i in postal_indices]
                     
                     if all_postal_matches:
                         logger.info(f"Found {len(all_postal_matches)} restaurants with postal code {invoice_postal_code}")
@@ -1162,18 +1638,11 @@ class PDFRenamer:
                             logger.info(f"  {i+1}. {restaurant.get('Nom', '')} (Site {restaurant.get('Site', '')}, CP {restaurant.get('CP', '')})")
                         
                         # Now match by name similarity within these postal code matches
-                        best_match = None
-                        best_similarity = 0.0
-                        
-                        for restaurant in all_postal_matches:
-                            restaurant_name = restaurant.get('Nom', '').lower()
-                            similarity = self._calculate_name_similarity(normalized_name, restaurant_name)
-                            if similarity > best_similarity:
-                                best_similarity = similarity
-                                best_match = restaurant
+                        best_index, best_similarity = self._best_name_match(normalized_name, postal_indices)
+                        best_match = self.restaurants_data[best_index] if best_index is not None else None
                         
                         if best_match and best_similarity > 0.3:  # Lower threshold for postal code validated matches
-                            site_number = best_match.get('Site', best_match.get('Code client'))
+                            site_number = self._site_of(best_match)
                             matched_name = best_match.get('Nom', '')
                             if site_number:
                                 logger.info(f"Found postal code + name match: {entreprise_name} -> {matched_name} (Site {site_number}, similarity: {best_similarity:.2f}, CP: {invoice_postal_code})")
@@ -1188,10 +1657,9 @@ class PDFRenamer:
             else:
                 # No postal code available - use first match as fallback (risky but legacy behavior)
                 logger.warning(f"No postal code available for validation - using first name match as fallback")
-                # Sort by name length (prefer shorter, more generic names)
-                name_matches.sort(key=lambda x: len(x.get('Nom', '')))
-                first_match = name_matches[0]
-                site_number = first_match.get('Site', first_match.get('Code client'))
+                # Prefer the shortest, most generic name (first one on ties)
+                first_match = min(name_matches, key=lambda x: len(x.get('Nom', '')))
+                site_number = self._site_of(first_match)
                 matched_name = first_match.get('Nom', '')
                 if site_number:
                     logger.warning(f"Using unvalidated fallback match: {entreprise_name} -> {matched_name} (Site {site_number})")
@@ -1199,52 +1667,71 @@ class PDFRenamer:
         
         return None, None
     
-    def _is_similar_restaurant_name(self, name1: str, name2: str) -> bool:
-        """Check if two restaurant names are similar (for fuzzy matching)."""
+    @staticmethod
+    def _site_of(restaurant: Dict):
+        """Return a restaurant's site number, falling back to its client code."""
+        site = restaurant.get('Site')
+        return site if site else restaurant.get('Code client')
+    
+    def _restaurant_name_key(self, name: str) -> Tuple[str, Optional[str], Tuple[str, ...], frozenset]:
+        """Precompute the parts of a restaurant name compared by _is_similar_name_key.
+
+        Returns (clean name, McDonald's location or None, location words longer than 2 chars, location word set).
+        """
         # Extract key components
-        name1_clean = re.sub(r'[^\w\s]', '', name1.lower())
-        name2_clean = re.sub(r'[^\w\s]', '', name2.lower())
-        
-        # For McDonald's, check if location matches
-        if any(variant in name1_clean for variant in ['mcdonald', 'mac do']):
-            if any(variant in name2_clean for variant in ['mcdonald', 'mac do']):
-                # Extract location parts
-                location1 = re.sub(r'(mcdonald[s]?|mac\s*do)', '', name1_clean).strip()
-                location2 = re.sub(r'(mcdonald[s]?|mac\s*do)', '', name2_clean).strip()
-                
-                # Check if locations match or are similar
-                return location1 in location2 or location2 in location1 or \
-                       any(word in location2.split() for word in location1.split() if len(word) > 2)
+        name_clean = _NON_WORD_RE.sub('', name.lower())
+        
+        # For McDonald's, keep the location part
+        if 'mcdonald' not in name_clean and 'mac do' not in name_clean:
+            return name_clean, None, (), frozenset()
+        location = _MCDO_STRIP_RE.sub('', name_clean).strip()
+        location_words = location.split()
+        return name_clean, location, tuple(word for word in location_words if len(word) > 2), frozenset(location_words)
+    
+    def _is_similar_name_key(self, key1: Tuple, key2: Tuple) -> bool:
+        """Compare two keys built by _restaurant_name_key."""
+        name1_clean, location1, long_words1, _ = key1
+        name2_clean, location2, _, location_words2 = key2
+        
+        # For McDonald's, check if locations match or are similar
+        if location1 is not None and location2 is not None:
+            return location1 in location2 or location2 in location1 or \
+                   any(word in location_words2 for word in long_words1)
         
         # For non-McDonald's restaurants, check for direct name similarity
         return name1_clean == name2_clean or name1_clean in name2_clean or name2_clean in name1_clean
     
     def _determine_collecte_suffix(self, collecte: str) -> str:
         """Return the collecte name without waste type suffixes and spaces removed."""
-        return collecte.upper().replace(' ', '')
+        return _collecte_suffix(collecte)
     
     def _sanitize_invoice_number(self, invoice_number: str) -> str:
         """Sanitize invoice number by removing accents and all non-alphanumeric characters."""
         if not invoice_number:
             return invoice_number
         
-        # Normalize to remove accents, preserving case
-        deaccented = ''.join(c for c in unicodedata.normalize('NFKD', invoice_number) if not unicodedata.combining(c))
+        # Plain ASCII (the usual case) has no accents to strip
+        if invoice_number.isascii():
+            return _NON_ALNUM_RE.sub('', invoice_number)
         
-        # Remove all non-alphanumeric characters
-        sanitized = re.sub(r'[^a-zA-Z0-9]', '', deaccented)
+        # French accents go through a translation table, preserving case
+        deaccented = invoice_number.translate(_DEACCENT_TABLE)
+        if not deaccented.isascii():
+            # Rare characters: normalize to remove accents; dropping what is left outside ASCII also drops the
+            # combining marks, and everything non-ASCII is removed by the regex below anyway
+            deaccented = unicodedata.normalize('NFKD', deaccented).encode('ascii', 'ignore').decode('ascii')
         
-        return sanitized.replace('\\', '')
+        # Remove all non-alphanumeric characters
+        return _NON_ALNUM_RE.sub('', deaccented)
     
     def _format_date(self, date_str: str) -> str:
         """Format date from DD/MM/YYYY to MMYYYY."""
-        try:
-            # Parse the date
-            date_obj = datetime.strptime(date_str, '%d/%m/%Y')
-            return date_obj.strftime('%m%Y')
-        except ValueError:
-            logger.error(f"Could not parse date: {date_str}")
-            return "UNKNOWN"
+        month_year = _month_year(date_str)
+        if month_year is not None:
+            return month_year
+        
+        logger.error(f"Could not parse date: {date_str}")
+        return "UNKNOWN"
     
     def generate_new_filename(self, pdf_path: Path) -> Optional[str]:
         """Generate new filename for a PDF based on its content."""
@@ -1308,7 +1795,7 @@ class PDFRenamer:
         if not analysis:
             error_details = {
                 'error': 'Gemini analysis failed or returned no data',
-                'pdf_size': f"{pdf_path.stat().st_size} bytes",
+                'pdf_size': self._pdf_size_description(pdf_path),
                 'file_extension': pdf_path.suffix
             }
             return None, error_details
@@ -1374,7 +1861,7 @@ class PDFRenamer:
         # Validate that the collector is in our valid collectors list
         if not self._validate_collector(invoice_provider, base_collecte):
             extracted_data['error'] = f"Invalid collector '{base_collecte}' not in approved collectors list"
-            extracted_data['valid_collectors'] = sorted(list(self.valid_collectors))
+            extracted_data['valid_collectors'] = list(self.valid_collectors_sorted)
             return None, extracted_data
         
         extracted_data['base_collecte'] = base_collecte
@@ -1387,15 +1874,19 @@ class PDFRenamer:
             extracted_data['error'] = f"Could not find site number for '{search_term}' with collecte '{base_collecte}'"
             # Find similar restaurant names for debugging
             similar_restaurants = []
-            for restaurant in self.restaurants_data:
-                restaurant_name = restaurant.get('Nom', '')
-                if entreprise and any(word in restaurant_name.lower() for word in entreprise.lower().split() if len(word) > 2):
-                    similar_restaurants.append({
-                        'name': restaurant_name,
-                        'site': restaurant.get('Site', restaurant.get('Code client')),
-                        'collecte': base_collecte
-                    })
-            extracted_data['similar_restaurants'] = similar_restaurants[:5]  # Top 5 matches
+            search_words = [word for word in entreprise.lower().split() if len(word) > 2] if entreprise else []
+            if search_words:
+                for i, restaurant_name_lower in enumerate(self.restaurant_names_lower):
+                    if any(word in restaurant_name_lower for word in search_words):
+                        restaurant = self.restaurants_data[i]
+                        similar_restaurants.append({
+                            'name': restaurant.get('Nom', ''),
+                            'site': self._site_of(restaurant),
+                            'collecte': base_collecte
+                        })
+                        if len(similar_restaurants) == 5:  # Top 5 matches
+                            break
+            extracted_data['similar_restaurants'] = similar_restaurants
             return None, extracted_data
         
         extracted_data['site_number'] = site_number
@@ -1419,8 +1910,30 @@ class PDFRenamer:
         
         return new_filename, extracted_data
 
-    def rename_pdfs_in_directory(self, directory: Path, dry_run: bool = True) -> Dict:
-        """Rename all PDFs in a directory."""
+    def _pdf_size_description(self, pdf_path: Path) -> str:
+        """Size of a PDF for failure reports, from a single stat call."""
+        try:
+            return f"{pdf_path.stat().st_size} bytes"
+        except OSError:
+            return "unknown"
+    
+    def find_pdf_files(self, directory: Path) -> List[Path]:
+        """List the PDFs directly inside a directory, case-insensitive (.pdf or .PDF)."""
+        # scandir exposes the entry type from the directory listing, so no extra stat per file
+        with os.scandir(directory) as entries:
+            return [Path(entry.path) for entry in entries
+                    if entry.name.lower().endswith('.pdf') and entry.is_file()]
+    
+    def is_renamed_filename(self, filename: str) -> bool:
+        """Whether a filename is the output of a previous run and needs no analysis."""
+        return self.renamed_filename_re.match(filename) is not None
+    
+    def rename_pdfs_in_directory(self, directory: Path, dry_run: bool = True,
+                                 pdf_files: Optional[List[Path]] = None) -> Dict:
+        """Rename all PDFs in a directory.
+
+        pdf_files may carry the listing already returned by find_pdf_files.
+        """
         results = {
             'success': [],
             'failed': [],
@@ -1428,62 +1941,91 @@ class PDFRenamer:
         }
         
         # Pick up all PDFs, case-insensitive (.pdf or .PDF)
-        pdf_files = [f for f in directory.iterdir() if f.is_file() and f.suffix.lower() == '.pdf']
+        if pdf_files is None:
+            pdf_files = self.find_pdf_files(directory)
         
         # Log processing start
         rate_status = self.get_rate_limit_status()
         self.processing_logger.log_processing_start(len(pdf_files), str(directory), dry_run, rate_status)
         
-        for i, pdf_file in enumerate(pdf_files, 1):
-            self.processing_logger.log_file_processing_start(pdf_file.name, i, len(pdf_files))
+        # Skip files renamed by a previous run before spending a PDF parse and an API request
+        pending_files = []
+        for pdf_file in pdf_files:
+            if self.is_renamed_filename(pdf_file.name):
+                reason = "File name already matches the target pattern"
+                self.processing_logger.log_file_skipped(pdf_file.name, reason)
+                results['skipped'].append({
+                    'original': str(pdf_file),
+                    'target': str(pdf_file),
+                    'reason': 'Already renamed'
+                })
+            else:
+                pending_files.append(pdf_file)
+        
+        # Analyze PDFs concurrently; the rate limiter is the single serialization point for API requests.
+        # Results are handled as they complete, and renaming and result logging stay on this thread.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as analysis_pool:
+            futures = {
+                analysis_pool.submit(self._analyze_pending_file, pdf_file, i, len(pending_files)): pdf_file
+                for i, pdf_file in enumerate(pending_files, 1)
+            }
             
             try:
-                new_filename, extracted_data = self.generate_new_filename_with_details(pdf_file)
-                
-                if new_filename:
-                    new_path = pdf_file.parent / new_filename
-                    
-                    if new_path.exists():
-                        reason = f"Target file already exists: {new_filename}"
-                        self.processing_logger.log_file_skipped(pdf_file.name, reason)
-                        results['skipped'].append({
-                            'original': str(pdf_file),
-                            'target': str(new_path),
-                            'reason': 'Target file already exists'
-                        })
-                        continue
+                for future in as_completed(futures):
+                    pdf_file = futures[future]
                     
-                    if not dry_run:
-                        pdf_file.rename(new_path)
+                    try:
+                        new_filename, extracted_data = future.result()
                     
-                    self.processing_logger.log_file_success(pdf_file.name, new_filename, extracted_data, dry_run)
-                    results['success'].append({
-                        'original': str(pdf_file),
-                        'new': str(new_path)
-                    })
-                else:
-                    reason = "Could not generate filename - missing or invalid data from AI analysis"
-                    details = {
-                        'extracted_data': extracted_data,
-                        'pdf_size': f"{pdf_file.stat().st_size} bytes"
-                    }
-                    self.processing_logger.log_file_failure(pdf_file.name, reason, details)
-                    results['failed'].append({
-                        'file': str(pdf_file),
-                        'reason': reason
-                    })
-                    
-            except Exception as e:
-                reason = f"Processing error: {str(e)}"
-                details = {
-                    'error_type': type(e).__name__,
-                    'pdf_size': f"{pdf_file.stat().st_size} bytes" if pdf_file.exists() else "unknown"
-                }
-                self.processing_logger.log_file_failure(pdf_file.name, reason, details)
-                results['failed'].append({
-                    'file': str(pdf_file),
-                    'reason': reason
-                })
+                        if new_filename:
+                            new_path = pdf_file.parent / new_filename
+                        
+                            if new_path.exists():
+                                reason = f"Target file already exists: {new_filename}"
+                                self.processing_logger.log_file_skipped(pdf_file.name, reason)
+                                results['skipped'].append({
+                                    'original': str(pdf_file),
+                                    'target': str(new_path),
+                                    'reason': 'Target file already exists'
+                                })
+                                continue
+                        
+                            if not dry_run:
+                                pdf_file.rename(new_path)
+                        
+                            self.processing_logger.log_file_success(pdf_file.name, new_filename, extracted_data, dry_run)
+                            results['success'].append({
+                                'original': str(pdf_file),
+                                'new': str(new_path)
+                            })
+                        else:
+                            reason = "Could not generate filename - missing or invalid data from AI analysis"
+                            details = {
+                                'extracted_data': extracted_data,
+                                'pdf_size': self._pdf_size_description(pdf_file)
+                            }
+                            self.processing_logger.log_file_failure(pdf_file.name, reason, details)
+                            results['failed'].append({
+                                'file': str(pdf_file),
+                                'reason': reason
+                            })
+                        
+                    except Exception as e:
+                        reason = f"Processing error: {str(e)}"
+                        details = {
+                            'error_type': type(e).__name__,
+                            'pdf_size': self._pdf_size_description(pdf_file)
+                        }
+                        self.processing_logger.log_file_failure(pdf_file.name, reason, details)
+                        results['failed'].append({
+                            'file': str(pdf_file),
+                            'reason': reason
+                        })
+            except BaseException:
+                # Ctrl+C or an error while handling results: drop the queued files instead of
+                # spending an API request on each before exiting; only in-flight analyses finish
+                analysis_pool.shutdown(wait=False, cancel_futures=True)
+                raise
         
         # Log session end
         final_rate_status = self.get_rate_limit_status()
@@ -1491,6 +2033,11 @@ class PDFRenamer:
         
         return results
 
+    def _analyze_pending_file(self, pdf_file: Path, file_index: int, total_files: int) -> Tuple[Optional[str], Dict]:
+        """Worker task: log the file's start line, then analyze it, so the header precedes the file's analysis logs."""
+        self.processing_logger.log_file_processing_start(pdf_file.name, file_index, total_files)
+        return self.generate_new_filename_with_details(pdf_file)
+    
     def get_rate_limit_status(self) -> Dict:
         """Get current rate limiting status."""
         return self.rate_limiter.get_status()
@@ -1511,54 +2058,83 @@ class PDFRenamer:
         provider_upper = provider_name.upper()
         
         # 1. Check for an exact match in the alias dictionary first
-        for alias, parent in self.provider_aliases.items():
-            if alias.upper() in provider_upper:
-                logger.info(f"Found provider '{alias}' and mapped to parent '{parent}' via alias dictionary.")
-                return parent
+        alias_match = self._find_provider_alias(provider_upper)
+        if alias_match:
+            alias, parent = alias_match
+            logger.info(f"Found provider '{alias}' and mapped to parent '{parent}' via alias dictionary.")
+            return parent
 
         # Split by common delimiters like space, hyphen, or period.
-        provider_words = set(re.split(r'[\s.-]', provider_upper))
+        provider_words = set(_PROVIDER_SPLIT_RE.split(provider_upper))
 
         # 1. Word-based match (e.g., "SUEZ" in "SUEZ EAU FRANCE")
-        # More robust than substring; we sort by word count to prioritize more specific matches.
-        sorted_collectors_by_word_count = sorted(self.prestataires_data.keys(), key=lambda x: len(x.split()), reverse=True)
-        for collecte in sorted_collectors_by_word_count:
-            collecte_upper = collecte.upper()
-            collecte_words = set(collecte_upper.split())
+        # More robust than substring; collectors are pre-sorted by word count to prioritize more specific matches.
+        for collecte, collecte_words in self.collectors_by_word_count:
             if collecte_words.issubset(provider_words):
                 logger.info(f"Found base collecte '{collecte}' via word match in provider '{provider_name}'")
                 return collecte
 
         # 2. Substring match as a fallback (e.g., "PAPREC" in "PAPREC IDF")
-        # Sort collectors by length (longest first) to avoid partial matches like "PAP" instead of "PAPREC".
-        sorted_collectors_by_len = sorted(self.prestataires_data.keys(), key=len, reverse=True)
-        for collecte in sorted_collectors_by_len:
-            collecte_upper = collecte.upper()
-            if collecte_upper in provider_upper:
-                logger.info(f"Found base collecte '{collecte}' via substring match in provider '{provider_name}'")
-                return collecte
+        # Collectors are pre-sorted by length (longest first) to avoid partial matches like "PAP" instead of "PAPREC".
+        if self.collector_automaton is not None:
+            # One pass over the provider name finds every collector it contains
+            position = _longest_substring_match(self.collector_automaton, provider_upper)
+            substring_matches = [self.collectors_by_length[position]] if position is not None else []
+        else:
+            substring_matches = (item for item in self.collectors_by_length if item[1] in provider_upper)
+        for collecte, collecte_upper in substring_matches:
+            logger.info(f"Found base collecte '{collecte}' via substring match in provider '{provider_name}'")
+            return collecte
         
         # 3. Fuzzy matching for spelling variations (e.g., ALCHIMISTES vs ALCHEMISTES)
-        best_match = None
-        best_ratio = 0.0
-        # Compare each known collector against each word from the invoice's provider name
-        for collecte in self.prestataires_data.keys():
-            collecte_upper = collecte.upper()
-            for provider_word in provider_words:
-                ratio = SequenceMatcher(None, collecte_upper, provider_word).ratio()
-                if ratio > best_ratio:
-                    best_ratio = ratio
-                    best_match = collecte
-
         # Use a threshold to avoid false positives from fuzzy matching
         FUZZY_MATCH_THRESHOLD = 0.8
-        if best_ratio >= FUZZY_MATCH_THRESHOLD:
+        best_match, best_ratio = self._fuzzy_collector_match(provider_words, FUZZY_MATCH_THRESHOLD)
+        if best_match is not None:
             logger.info(f"Found base collecte '{best_match}' via fuzzy match in provider '{provider_name}' (ratio: {best_ratio:.2f})")
             return best_match
     
         logger.warning(f"Could not find base collecte name for provider '{provider_name}'")
         return None
 
+    def _find_provider_alias(self, provider_upper: str) -> Optional[Tuple[str, str]]:
+        """Return the longest (alias, parent) whose alias appears in the upper-case provider name, or None."""
+        if self.alias_automaton is not None:
+            position = _longest_substring_match(self.alias_automaton, provider_upper)
+            return self.alias_items[position] if position is not None else None
+        
+        matches = [item for item in self.alias_items if item[0].upper() in provider_upper]
+        return max(matches, key=lambda item: len(item[0]), default=None)
+    
+    def _fuzzy_collector_match(self, provider_words, threshold: float) -> Tuple[Optional[str], float]:
+        """Return the collector most similar to any provider word and its ratio, or (None, 0.0) below threshold.
+
+        Ties go to the collector listed first in Prestataires.csv.
+        """
+        best_index = None
+        best_ratio = 0.0
+        for provider_word in provider_words:
+            if _fuzz_process is not None:
+                # rapidfuzz's Indel ratio is never below difflib's, so one native call discards every collector
+                # that cannot reach the threshold; the survivors are scored with difflib as before
+                hits = _fuzz_process.extract(provider_word, self.collectors_upper, scorer=_fuzz.ratio,
+                                             score_cutoff=threshold * 100 - 1e-6, limit=None)
+                candidates = [(self.collectors_upper[index], index) for _, _, index in hits]
+            else:
+                # The ratio is at most 2 * min(len) / (len + len); skip pairs whose lengths alone rule out the threshold
+                word_len = len(provider_word)
+                candidates = [(collecte_upper, index) for index, collecte_upper in enumerate(self.collectors_upper)
+                              if 2 * min(len(collecte_upper), word_len) >= threshold * (len(collecte_upper) + word_len)]
+            for collecte_upper, index in candidates:
+                ratio = _similarity_ratio(collecte_upper, provider_word)
+                if ratio > best_ratio or (ratio == best_ratio and best_index is not None and index < best_index):
+                    best_ratio = ratio
+                    best_index = index
+        
+        if best_index is None or best_ratio < threshold:
+            return None, 0.0
+        return self.collectors[best_index], best_ratio
+    
     def _handle_invoice_with_site_number(self, analysis: Dict, extracted_data: Dict, provider_name: str) -> Tuple[Optional[str], Dict]:
         """Handle specific cases for invoices where site number is directly available."""
         logger.info(f"Handling special case for {provider_name} invoice")
@@ -1572,7 +2148,7 @@ class PDFRenamer:
         # Sanitize site number to remove non-digits and leading zeros
         if isinstance(site_number, str):
             # Remove all non-digit characters
-            site_number_digits = re.sub(r'\D', '', site_number)
+            site_number_digits = _NON_DIGIT_RE.sub('', site_number)
             if site_number_digits:
                 # Convert to int and back to string to remove leading zeros
                 site_number = str(int(site_number_digits))
@@ -1623,6 +2199,9 @@ def main():
     parser.add_argument('--weekly-summary', action='store_true', help='Show weekly API usage summary and exit')
     parser.add_argument('--reset-counter', action='store_true', help='Reset today\'s API request counter (use with caution)')
     parser.add_argument('--disable-detailed-logging', action='store_true', help='Disable detailed log files (console only)')
+    parser.add_argument('--no-cache', action='store_true', help='Re-analyze every PDF instead of reusing cached Gemini results')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f'Number of PDFs analyzed concurrently (default: {DEFAULT_MAX_WORKERS})')
     
     args = parser.parse_args()
     
@@ -1630,37 +2209,36 @@ def main():
     if args.status or args.weekly_summary or args.reset_counter:
         try:
             enable_detailed_logging = not args.disable_detailed_logging
-            renamer = PDFRenamer(args.api_key, args.csv_dir, enable_detailed_logging)
-            
-            if args.status:
-                status = renamer.get_rate_limit_status()
-                print(f"📊 Rate Limit Status:")
-                print(f"  Today: {status['requests_today']}/{status['max_per_day']} ({status['remaining_today']} remaining)")
-                print(f"  This minute: {status['requests_this_minute']}/{status['max_per_minute']} ({status['remaining_this_minute']} remaining)")
-                print(f"  Total lifetime requests: {status['total_lifetime_requests']}")
+            with PDFRenamer(args.api_key, args.csv_dir, enable_detailed_logging) as renamer:
+                if args.status:
+                    status = renamer.get_rate_limit_status()
+                    print(f"📊 Rate Limit Status:")
+                    print(f"  Today: {status['requests_today']}/{status['max_per_day']} ({status['remaining_today']} remaining)")
+                    print(f"  This minute: {status['requests_this_minute']}/{status['max_per_minute']} ({status['remaining_this_minute']} remaining)")
+                    print(f"  Total lifetime requests: {status['total_lifetime_requests']}")
                 
-                if status['historical_usage']:
-                    print(f"\n📈 Recent Usage (last 7 days):")
-                    for day in status['historical_usage']:
-                        print(f"    {day['date']}: {day['requests']} requests")
+                    if status['historical_usage']:
+                        print(f"\n📈 Recent Usage (last 7 days):")
+                        for day in status['historical_usage']:
+                            print(f"    {day['date']}: {day['requests']} requests")
                 
-            if args.weekly_summary:
-                summary = renamer.get_weekly_summary()
-                print(f"\n📅 Weekly Summary:")
-                print(f"  Total requests this week: {summary['weekly_total']}")
-                print(f"  Average per day: {summary['average_per_day']:.1f}")
-                print(f"\n  Daily breakdown:")
-                for day in summary['daily_breakdown']:
-                    print(f"    {day['day_name']} ({day['date']}): {day['requests']} requests")
+                if args.weekly_summary:
+                    summary = renamer.get_weekly_summary()
+                    print(f"\n📅 Weekly Summary:")
+                    print(f"  Total requests this week: {summary['weekly_total']}")
+                    print(f"  Average per day: {summary['average_per_day']:.1f}")
+                    print(f"\n  Daily breakdown:")
+                    for day in summary['daily_breakdown']:
+                        print(f"    {day['day_name']} ({day['date']}): {day['requests']} requests")
                 
-            if args.reset_counter:
-                print("⚠️  Are you sure you want to reset today's API request counter?")
-                response = input("This should only be done if you know the count is incorrect. Type 'yes' to confirm: ")
-                if response.lower() == 'yes':
-                    renamer.reset_daily_counter()
-                    print("✅ Today's request counter has been reset to 0")
-                else:
-                    print("❌ Reset cancelled")
+                if args.reset_counter:
+                    print("⚠️  Are you sure you want to reset today's API request counter?")
+                    response = input("This should only be done if you know the count is incorrect. Type 'yes' to confirm: ")
+                    if response.lower() == 'yes':
+                        renamer.reset_daily_counter()
+                        print("✅ Today's request counter has been reset to 0")
+                    else:
+                        print("❌ Reset cancelled")
                     
             return
         except Exception as e:
@@ -1674,8 +2252,8 @@ def main():
     # If just checking status
     if args.status:
         try:
-            renamer = PDFRenamer(args.api_key, args.csv_dir)
-            status = renamer.get_rate_limit_status()
+            with PDFRenamer(args.api_key, args.csv_dir) as renamer:
+                status = renamer.get_rate_limit_status()
             print(f"Rate Limit Status:")
             print(f"  Today: {status['requests_today']}/{status['max_per_day']} ({status['remaining_today']} remaining)")
             print(f"  This minute: {status['requests_this_minute']}/{status['max_per_minute']} ({status['remaining_this_minute']} remaining)")
@@ -1706,7 +2284,8 @@ def main():
     # Initialize renamer
     try:
         enable_detailed_logging = not args.disable_detailed_logging
-        renamer = PDFRenamer(args.api_key, csv_dir, enable_detailed_logging)
+        analysis_cache_dir = None if args.no_cache else DEFAULT_ANALYSIS_CACHE_DIR
+        renamer = PDFRenamer(args.api_key, csv_dir, enable_detailed_logging, analysis_cache_dir, args.workers)
         
         # Show initial rate limit status
         status = renamer.get_rate_limit_status()
@@ -1716,55 +2295,52 @@ def main():
         logger.error(f"Failed to initialize PDF renamer: {e}")
         return
     
-    # Count PDFs to process
-    pdf_files = list(pdf_dir.glob('*.pdf'))
-    total_pdfs = len(pdf_files)
-    
-    if total_pdfs > status['remaining_today']:
-        logger.warning(f"Found {total_pdfs} PDFs but only {status['remaining_today']} API requests remaining today")
-        response = input(f"Continue with processing the first {status['remaining_today']} files? (y/n): ")
-        if response.lower() != 'y':
-            logger.info("Processing cancelled by user")
-            return
-    
-    # Process files
-    results = renamer.rename_pdfs_in_directory(pdf_dir, args.dry_run)
-    
-    # Get reference to processing logger for cleanup
-    processing_logger = renamer.processing_logger
-    
-    # Show final rate limit status
-    final_status = renamer.get_rate_limit_status()
-    
-    # Print summary
-    print("\n" + "="*50)
-    print("PROCESSING SUMMARY")
-    print("="*50)
-    print(f"Successfully processed: {len(results['success'])}")
-    print(f"Failed: {len(results['failed'])}")
-    print(f"Skipped: {len(results['skipped'])}")
-    print(f"API requests used: {final_status['requests_today']}")
-    print(f"Remaining today: {final_status['remaining_today']}")
-    
-    if results['failed']:
-        print("\nFAILED FILES:")
-        for failed in results['failed']:
-            print(f"  - {failed['file']}: {failed['reason']}")
-    
-    if results['skipped']:
-        print("\nSKIPPED FILES:")
-        for skipped in results['skipped']:
-            print(f"  - {skipped['original']}: {skipped['reason']}")
-    
-    if args.dry_run:
-        print("\nNote: This was a dry run. No files were actually renamed.")
-    
-    if final_status['remaining_today'] <= 10:
-        print(f"\n⚠️  Warning: Only {final_status['remaining_today']} API requests remaining today!")
-    
-    # Log session end - Note: session end is already logged in rename_pdfs_in_directory()
-    # processing_logger.log_session_end(final_status)
-    processing_logger.cleanup()
+    # The with block closes the detailed log files on every exit path
+    with renamer:
+        # Count PDFs to process; files already renamed by a previous run are skipped without an API request
+        pdf_files = renamer.find_pdf_files(pdf_dir)
+        total_pdfs = sum(1 for pdf_file in pdf_files if not renamer.is_renamed_filename(pdf_file.name))
+        
+        if total_pdfs > status['remaining_today']:
+            logger.warning(f"Found {total_pdfs} PDFs but only {status['remaining_today']} API requests remaining today")
+            response = input(f"Continue with processing the first {status['remaining_today']} files? (y/n): ")
+            if response.lower() != 'y':
+                logger.info("Processing cancelled by user")
+                return
+        
+        # Process files
+        results = renamer.rename_pdfs_in_directory(pdf_dir, args.dry_run, pdf_files)
+        
+        # Show final rate limit status
+        final_status = renamer.get_rate_limit_status()
+        
+        # Print summary
+        print("\n" + "="*50)
+        print("PROCESSING SUMMARY")
+        print("="*50)
+        print(f"Successfully processed: {len(results['success'])}")
+        print(f"Failed: {len(results['failed'])}")
+        print(f"Skipped: {len(results['skipped'])}")
+        print(f"API requests used: {final_status['requests_today']}")
+        print(f"Remaining today: {final_status['remaining_today']}")
+        
+        if results['failed']:
+            print("\nFAILED FILES:")
+            for failed in results['failed']:
+                print(f"  - {failed['file']}: {failed['reason']}")
+        
+        if results['skipped']:
+            print("\nSKIPPED FILES:")
+            for skipped in results['skipped']:
+                print(f"  - {skipped['original']}: {skipped['reason']}")
+        
+        if args.dry_run:
+            print("\nNote: This was a dry run. No files were actually renamed.")
+        
+        if final_status['remaining_today'] <= 10:
+            print(f"\n⚠️  Warning: Only {final_status['remaining_today']} API requests remaining today!")
+        
+        # Session end is already logged in rename_pdfs_in_directory()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""Regression tests for restaurant matching in pdf_renamer."""
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+from pdf_renamer import PDFRenamer, _is_complete_analysis, _similarity_ratio
+
+REPO_DIR = Path(__file__).parent
+
+# Rows from "Liste des clients.xlsx": every client in the postal codes used below, plus the queried clients
+CLIENTS = [
+    {'Site': '328', 'Nom': "McDonald's Paris Porte Doree", 'Adresse': '282 Avenue Daumesnil', 'CP': '75012'},
+    {'Site': '391', 'Nom': "McDonald's Paris Reuilly Diderot", 'Adresse': '116 boulevard Diderot', 'CP': '75012'},
+    {'Site': '674', 'Nom': "McDonald's Paris Ledru Rollin Bk 12Eme", 'Adresse': '80 Rue Traversière', 'CP': '75012'},
+    {'Site': '437', 'Nom': "McDonald's Cannes Les Allees", 'Adresse': '2 rue Felix Faure', 'CP': '6400'},
+    {'Site': '1365', 'Nom': "McDonald's Le Mans Universite", 'Adresse': '35 avenue Olivier Messiaen', 'CP': '72000'},
+    {'Site': '106', 'Nom': "McDonald's Le Mans", 'Adresse': '207 avenue George Durand', 'CP': '72000'},
+    {'Site': '277', 'Nom': "McDonald's Le Mans Centre", 'Adresse': '31 place de république', 'CP': '72000'},
+    {'Site': '530', 'Nom': "McDonald's Le Mans Route De Bonnetable", 'Adresse': 'route de Bonnetable', 'CP': '72000'},
+    {'Site': '1587', 'Nom': "McDonald's Saint Cannat", 'Adresse': 'Lieu-Dit le Budeou RN7', 'CP': '13760'},
+    {'Site': '3005', 'Nom': 'KFC Bezons', 'Adresse': '16 20 RUE LOUIS RAMEAU', 'CP': '95870'},
+    {'Site': '4000', 'Nom': 'Intermarché Grigny', 'Adresse': 'Centre commercial du Hayon', 'CP': '69520'},
+    {'Site': '5017', 'Nom': 'Burger King Paris', 'Adresse': '279 Avenue Daumesnil', 'CP': '75012'},
+    {'Site': '5018', 'Nom': 'Quick Aulnay sous Bois', 'Adresse': "CC O'Parinor", 'CP': '93600'},
+    {'Site': '5019', 'Nom': 'Quick Aulnay sous Bois', 'Adresse': 'Rue Jacques Duclos', 'CP': '93600'},
+    {'Site': '5029', 'Nom': 'Burger King Portet sur Garonne', 'Adresse': "7 Bd de l'Europe", 'CP': '31120'},
+]
+
+
+@pytest.fixture
+def renamer(tmp_path, monkeypatch):
+    # Run from a scratch directory so the rate limiter and table caches never touch the real data
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(REPO_DIR / "Prestataires.csv", tmp_path / "Prestataires.csv")
+    monkeypatch.setattr(PDFRenamer, '_load_restaurants_data', lambda self: [dict(row) for row in CLIENTS])
+    return PDFRenamer("dummy-api-key", str(tmp_path), enable_detailed_logging=False, analysis_cache_dir=None)
+
+
+@pytest.mark.parametrize("name1, name2, expected", [
+    ("mcdonald's saint cannat", "burger king portet sur garonne", 0.113),
+    ("kfc bezons", "mcdonald's le mans", 0.286),
+])
+def test_similarity_ratio_is_difflib_ratio(name1, name2, expected):
+    # The 0.3/0.5 matching thresholds are tuned for SequenceMatcher, not an Indel ratio
+    assert _similarity_ratio(name1, name2) == pytest.approx(expected, abs=1e-3)
+
+
+@pytest.mark.parametrize("entreprise, address", [
+    ("KFC Bezons", "1 rue inconnue 72000"),
+    ("McDonald's Saint Cannat", "7 Bd de l'Europe 31120"),
+    ("Intermarché Grigny", "1 rue inconnue 75012"),
+    ("McDonald's Cannes Les Allees", "1 rue inconnue 93600"),
+])
+def test_other_brand_in_postal_code_is_not_matched(renamer, entreprise, address):
+    # The invoice's client is not in that postal code; a different client there must not be picked instead
+    assert renamer._find_restaurant_site(entreprise, "SUEZ", address) == (None, None)
+
+
+@pytest.mark.parametrize("analysis, expected", [
+    ({}, False),
+    ([], False),
+    ({'entreprise': "McDonald's Le Mans"}, False),
+    ({'entreprise': "McDonald's Le Mans", 'invoice_provider': 'SUEZ', 'invoice_date': '01/05/2025'}, False),
+    ({'entreprise': "McDonald's Le Mans", 'invoice_provider': 'SUEZ', 'invoice_date': '01/05/2025',
+      'invoice_number': 'H0E0228333'}, True),
+    ({'invoice_provider': 'VEOLIA', 'invoice_date': '01/05/2025', 'invoice_number': '42', 'site_number': '865'}, True),
+])
+def test_only_complete_analyses_are_cached(analysis, expected):
+    # A cached answer is reused without calling Gemini, so an incomplete one would fail the file on every run
+    assert _is_complete_analysis(analysis) is expected
+
+
+@pytest.mark.parametrize("filename, expected", [
+    ("106-ATESIS-052024-H0E0228333.pdf", True),
+    ("106-collectea-122024-42.PDF", True),
+    ("2024-FACTURE-202405-123.pdf", False),
+    ("106-ATESIS-132024-42.pdf", False),
+    ("106-ATESIS-UNKNOWN-42.pdf", False),
+])
+def test_renamed_filename_needs_known_collecte_and_month(renamer, filename, expected):
+    # Files matching are skipped without analysis, so an unrelated dashed name must not match
+    assert renamer.is_renamed_filename(filename) is expected
+
+
+BLOCKING_QUERIES = [row['Nom'] for row in CLIENTS] + [
+    "McDonald's", "McDonald's Le Mans Centre Ville", "Mac Do Bezons", "McDonald's Traversiere", "MCDONALDS REUILLY",
+    "McDonald's Sud Reuilly", "KFC", "Restaurant KFC Bezons", "Quick", "Burger King", "Intermarche Grigny", "Le", "",
+    "Daumesnil", "Aulnay sous Bois Parinor",
+]
+
+
+@pytest.mark.parametrize("query", BLOCKING_QUERIES)
+def test_blocking_indexes_keep_every_matching_row(renamer, query):
+    # The trigram indexes only prune the full-table scan, so they must return every row a full scan would match
+    name_key = renamer._restaurant_name_key(query.lower())
+    similar = {i for i, key in enumerate(renamer.restaurant_name_keys) if renamer._is_similar_name_key(name_key, key)}
+    assert similar <= renamer._similar_name_candidates(name_key)
+
+    keywords = set(query.lower().split())
+    keywords.update(word[1:-1] for word in query.lower().split())
+    for keyword in keywords:
+        in_address = {i for i, address in enumerate(renamer.restaurant_addresses_unaccented) if keyword in address}
+        assert in_address <= renamer.address_index.candidates(keyword)